@@ -1,10 +1,18 @@
+import copy
+import os
 import numpy as np
 from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import chain, repeat
 import pandas as pd
-import math
+from sharedmem import attach, share
 
 class Node:
-    def __init__(self, feature=None, threshold=None, children=None, left=None, right=None, value=None, is_discrete=False):
+    __slots__ = ("feature", "threshold", "children", "left", "right", "value", "is_discrete", "major")
+
+    # major 为离散节点上训练样本的多数类，预测时遇到没见过的取值直接返回它
+    def __init__(self, feature=None, threshold=None, children=None, left=None, right=None, value=None, is_discrete=False, major=None):
         self.feature = feature
         self.threshold = threshold
         self.children = children or {}
@@ -12,135 +20,512 @@ class Node:
         self.right = right
         self.value = value
         self.is_discrete = is_discrete
+        self.major = major
 
     def is_leaf(self):
         return self.value is not None
 
 
+# fit 之后把链式 Node 编译成并列数组：feature[i] < 0 表示叶子，value[i] 为叶子类别在 classes 中的下标
+# 离散节点 i 的子节点表为 child[child_offset[i] + 取值编码]；每个离散节点另有一片叶子 fallback[i] 存放其 major，
+# 该节点没见过的取值都走到这片叶子，因此任何样本都只走一条根到叶的路径
+class FlatTree:
+    __slots__ = ("feature", "threshold", "left", "right", "value", "classes", "is_discrete", "child_offset", "child", "fallback", "categories")
+
+    def __init__(self, root: Node, categories):
+        nodes = [root]
+        for node in nodes:
+            if node.is_leaf():
+                continue
+            if node.is_discrete:
+                nodes += list(node.children.values())
+            else:
+                nodes += [node.left, node.right]
+        ids = {id(node): i for i, node in enumerate(nodes)}
+        self.categories = categories
+        self.classes = np.unique([node.value if node.is_leaf() else node.major for node in nodes if node.is_leaf() or node.is_discrete])
+        extra = len(nodes)
+        size = extra + sum(1 for node in nodes if not node.is_leaf() and node.is_discrete)
+        self.feature = np.full(size, -1, dtype=np.intp)
+        self.threshold = np.zeros(size)
+        self.left = np.full(size, -1, dtype=np.intp)
+        self.right = np.full(size, -1, dtype=np.intp)
+        self.value = np.full(size, -1, dtype=np.intp)
+        self.is_discrete = np.zeros(size, dtype=bool)
+        self.child_offset = np.zeros(size, dtype=np.intp)
+        self.fallback = np.full(size, -1, dtype=np.intp)
+        child = []
+        for i, node in enumerate(nodes):
+            if node.is_leaf():
+                self.value[i] = np.searchsorted(self.classes, node.value)
+                continue
+            self.feature[i] = node.feature
+            if node.is_discrete:
+                cats = categories[node.feature]
+                self.is_discrete[i] = True
+                self.child_offset[i] = len(child)
+                self.fallback[i] = extra
+                self.value[extra] = np.searchsorted(self.classes, node.major)
+                table = [extra] * len(cats)
+                extra += 1
+                for val, sub in node.children.items():
+                    table[np.searchsorted(cats, val)] = ids[id(sub)]
+                child += table
+            else:
+                self.threshold[i] = node.threshold
+                self.left[i] = ids[id(node.left)]
+                self.right[i] = ids[id(node.right)]
+        self.child = np.array(child, dtype=np.intp)
+
+    # 整批样本逐层下推，返回每行到达的叶子；给出 lengths 时累加每行经过的内部节点数
+    def route(self, x, lengths=None):
+        node = np.zeros(len(x), dtype=np.intp)
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while len(active):
+            if lengths is not None:
+                lengths[active] += 1
+            cur = node[active]
+            nxt = np.empty_like(cur)
+            disc = self.is_discrete[cur]
+            cont = np.flatnonzero(~disc)
+            c = cur[cont]
+            go_left = x[active[cont], self.feature[c]] <= self.threshold[c]
+            nxt[cont] = np.where(go_left, self.left[c], self.right[c])
+            for f in np.unique(self.feature[cur[disc]]):
+                sel = np.flatnonzero(disc & (self.feature[cur] == f))
+                vals = x[active[sel], f]
+                cats = self.categories[f]
+                code = np.minimum(np.searchsorted(cats, vals), len(cats) - 1)
+                hit = cats[code] == vals
+                nxt[sel] = np.where(hit, self.child[self.child_offset[cur[sel]] + code], self.fallback[cur[sel]])
+            node[active] = nxt
+            active = active[self.feature[nxt] >= 0]
+        return node
+
+
+# 进程后端的 worker：建树开始时训练数据放进共享内存，worker 进程初始化时映射一次，同时收到一份不带训练结果
+# 和 profiler 的模型副本；之后每个任务只传方法名、行下标和特征号等少量参数，由 _worker_call 在副本上调用
+_model = None
+_data = None
+# 进程后端下样本数少于此值的节点不分发特征扫描
+PROCESS_MIN_ROWS = 2000
+
+
+def _worker_init(model, *specs):
+    global _model, _data
+    _model = model
+    _data = attach(*specs)
+
+
+def _worker_call(name, *args):
+    return getattr(_model, name)(*_data, *args)
+
+
 class C45:
-    def __init__(self, min_samples_split=2, max_depth=10):
+    def __init__(self, min_samples_split=2, max_depth=10, max_bins=None, n_jobs=1, backend="thread", subtree_cutoff=0, feature_types=None, profiler=None):
         self.min_samples_split = min_samples_split
         self.max_depth = max_depth
+        self.max_bins = max_bins
+        # n_jobs > 1 时按特征并行搜索分割点；样本数不超过 subtree_cutoff 的子树整棵交给一个 worker
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.backend = backend
+        self.subtree_cutoff = subtree_cutoff
+        # 可选的 profiling.Profiler，None 时不做任何记录
+        self.profiler = profiler
         self.root = None
-        self.feature_types = None
-
-    def _entropy(self, y):
-        if len(y) == 0:
-            return 0
-        probs = [count / len(y) for count in Counter(y).values()]
-        return -sum(p * math.log2(p) for p in probs if p > 0)
-
-    def _ent(self, subsets):
-        total = sum(len(s) for s in subsets)
-        if total == 0:
-            return 1
-        entropy= 0
-        for subset in subsets:
-            if len(subset) == 0:
-                continue
-            p = len(subset) / total
-            entropy -= p * math.log2(p)
-        return entropy if entropy > 0 else 1
-
-    def _gain_ratio_continuous(self, y, y_left, y_right):
-        before = self._entropy(y)
-        after = (len(y_left) / len(y)) * self._entropy(y_left) + (len(y_right) / len(y)) * self._entropy(y_right)
-        info_gain = before - after
-        split = self._ent([y_left, y_right])
-        return info_gain / split if split > 0 else 0
-
-    def _gain_ratio_discrete(self, y, subsets):
-        before = self._entropy(y)
-        after = sum((len(s) / len(y)) * self._entropy(s) for s in subsets)
-        info_gain = before - after
-        split = self._ent(subsets)
-        return info_gain / split if split > 0 else 0
-
-    def _find_best_split(self, x, y):
+        self.flat = None
+        self.feature_types = feature_types
+        self.categories = None
+        self.bin_edges = None
+        self.bin_next = None
+
+    def _entropy_counts(self, cnt):
+        tot = cnt.sum(axis=-1, keepdims=True)
+        p = cnt / np.maximum(tot, 1)
+        return -np.sum(p * np.log2(np.where(p > 0, p, 1)), axis=-1)
+
+    def _ent_counts(self, sizes):
+        entropy = self._entropy_counts(sizes)
+        return np.where(entropy > 0, entropy, 1)
+
+    def _gain_ratio_continuous(self, before, left, right):
+        left_num = left.sum(axis=1)
+        right_num = right.sum(axis=1)
+        tot = left_num + right_num
+        after = (left_num / tot) * self._entropy_counts(left) + (right_num / tot) * self._entropy_counts(right)
+        split = self._ent_counts(np.stack([left_num, right_num], axis=1))
+        return (before - after) / split
+
+    def _gain_ratio_discrete(self, before, table):
+        sizes = table.sum(axis=1)
+        after = np.sum((sizes / sizes.sum()) * self._entropy_counts(table))
+        return (before - after) / self._ent_counts(sizes)
+
+    def _scan_continuous(self, col, y_code, one_hot, total, before):
+        sorted_idx = np.argsort(col)
+        x_sorted = col[sorted_idx]
+        y_sorted = y_code[sorted_idx]
+
+        # 候选阈值仍取相邻样本类别变化处的中点，各候选的左右类别计数由前缀和一次得到
+        pos = np.flatnonzero(y_sorted[1:] != y_sorted[:-1]) + 1
+        thresholds = (x_sorted[pos] + x_sorted[pos - 1]) / 2
+        left_num = np.searchsorted(x_sorted, thresholds, side="right")
+        valid = (left_num > 0) & (left_num < len(col))
+        if not valid.any():
+            return -1, None, False, None, 0
+        thresholds = thresholds[valid]
+        cum = np.zeros((len(col) + 1, len(total)), dtype=np.int64)
+        np.cumsum(one_hot[sorted_idx], axis=0, out=cum[1:])
+        left = cum[left_num[valid]]
+        gain_ratio = self._gain_ratio_continuous(before, left, total - left)
+        i = np.argmax(gain_ratio)
+        return gain_ratio[i], thresholds[i], False, None, len(thresholds)
+
+    def _scan_discrete(self, col, card, y_code, before):
+        # 取值 × 类别的列联表一次 bincount 得到，行下标即 fit 时的取值编码
+        k = len(self.classes)
+        table = np.bincount(col * k + y_code, minlength=card * k).reshape(card, k)
+        present = np.flatnonzero(table.sum(axis=1))
+        return self._gain_ratio_discrete(before, table[present]), None, True, present, 1
+
+    # 返回 (增益率, 阈值, 是否离散, 离散子节点取值, 候选数)；候选数交给调用方记录，worker 线程里没有当前节点
+    def _scan_feature(self, feat_idx, col, y_code, one_hot, total, before):
+        if self.feature_types[feat_idx] == "continuous":
+            return self._scan_continuous(col, y_code, one_hot, total, before)
+        return self._scan_discrete(col, len(self.categories[feat_idx]), y_code, before)
+
+    def _column(self, x, disc, rows, feat_idx):
+        if self.feature_types[feat_idx] == "continuous":
+            return x[rows, feat_idx]
+        return disc[rows, self.disc_index[feat_idx]]
+
+    def _one_hot(self, y_code):
+        one_hot = np.zeros((len(y_code), len(self.classes)), dtype=np.int64)
+        one_hot[np.arange(len(y_code)), y_code] = 1
+        total = one_hot.sum(axis=0)
+        return one_hot, total, self._entropy_counts(total)
+
+    # 进程后端的一个任务：在 worker 里由共享的数据取出本节点的列，依次扫描 feats
+    def _scan_features(self, x, disc, y_code, rows, feats):
+        y_code = y_code[rows]
+        one_hot, total, before = self._one_hot(y_code)
+        return [self._scan_feature(f, self._column(x, disc, rows, f), y_code, one_hot, total, before) for f in feats]
+
+    def _find_best_split(self, x, disc, y_code, rows, pool=None):
         best_gr = -1
         best_feature = None
         best_threshold = None
         best_is_discrete = False
-        best_children_vals = None
+        best_children = None
+        y_code = y_code[rows]
+        one_hot, total, before = self._one_hot(y_code)
+
+        feats = range(len(self.feature_types))
+        # 小节点的扫描比一次进程间往返还便宜，留在主进程里做
+        if pool is not None and self.backend == "process" and len(rows) >= PROCESS_MIN_ROWS:
+            # 特征分成 n_jobs 块，每块一个任务，行下标每块只传一次
+            chunks = [chunk for chunk in np.array_split(np.arange(len(feats)), self.n_jobs) if len(chunk)]
+            results = chain.from_iterable(pool.map(_worker_call, repeat("_scan_features"), repeat(rows), chunks))
+        else:
+            cols = (self._column(x, disc, rows, feat_idx) for feat_idx in feats)
+            args = (feats, cols, repeat(y_code), repeat(one_hot), repeat(total), repeat(before))
+            use_pool = pool is not None and self.backend != "process"
+            results = pool.map(self._scan_feature, *args) if use_pool else map(self._scan_feature, *args)
+        # 结果按特征顺序归并，严格大于才更新，与 worker 数无关
+        candidates = 0
+        for feat_idx, (gain_ratio, threshold, is_discrete, children, n_candidates) in enumerate(results):
+            candidates += n_candidates
+            if gain_ratio > best_gr:
+                best_gr = gain_ratio
+                best_feature = feat_idx
+                best_threshold = threshold
+                best_is_discrete = is_discrete
+                best_children = children
+
+        if self.profiler is not None:
+            self.profiler.add("candidates", candidates)
+            self.profiler.add("bytes_copied", len(rows) * len(feats) * x.itemsize + one_hot.nbytes)
+            if best_feature is not None:
+                self.profiler.set(gain=float(best_gr))
+        return best_feature, best_threshold, best_is_discrete, best_children
+
+    def _span(self, name):
+        return nullcontext() if self.profiler is None else self.profiler.span(name)
+
+    # arrays 为进程后端要放进共享内存的训练数据；池先于共享内存关闭
+    @contextmanager
+    def _pool(self, *arrays):
+        if self.n_jobs <= 1:
+            yield None
+        elif self.backend == "process":
+            with share(*arrays) as specs:
+                with ProcessPoolExecutor(self.n_jobs, initializer=_worker_init, initargs=(self._worker_model(), *specs)) as pool:
+                    yield pool
+        else:
+            with ThreadPoolExecutor(self.n_jobs) as pool:
+                yield pool
+
+    # 发给 worker 进程的模型副本：不带上一次的训练结果和 profiler，在 worker 里串行建树
+    def _worker_model(self):
+        model = copy.copy(self)
+        model.root = model.flat = model.profiler = None
+        model.n_jobs = 1
+        return model
+
+    # 把交给 worker 的子树（Future）替换为建好的节点
+    def _resolve(self, node):
+        if isinstance(node, Future):
+            return node.result()
+        if node.is_discrete:
+            node.children = {val: self._resolve(child) for val, child in node.children.items()}
+        elif not node.is_leaf():
+            node.left = self._resolve(node.left)
+            node.right = self._resolve(node.right)
+        return node
 
+    # 按 mask 把 idx[start:end] 稳定地划分为左右两段，返回分界位置；稳定划分保证样本相对次序与拷贝子数组时一致
+    def _partition(self, idx, start, end, mask):
+        rows = idx[start:end]
+        left, right = rows[mask], rows[~mask]
+        if self.profiler is not None:
+            self.profiler.add("masks", 2)
+            self.profiler.add("bytes_copied", 2 * mask.nbytes + rows.nbytes)
+        mid = start + len(left)
+        idx[start:mid] = left
+        idx[mid:end] = right
+        return mid
+
+    # 按取值编码把 idx[start:end] 稳定地排成连续的若干段，返回各子节点的 [start, end) 边界
+    def _partition_codes(self, idx, start, end, col, children_codes):
+        rows = idx[start:end]
+        idx[start:end] = rows[np.argsort(col, kind="stable")]
+        if self.profiler is not None:
+            self.profiler.add("bytes_copied", 2 * rows.nbytes)
+        sizes = np.bincount(col)[children_codes]
+        return start + np.concatenate(([0], np.cumsum(sizes)))
+
+    def _create(self, x, disc, y_code, idx, start, end, depth, pool=None):
+        if self.profiler is None:
+            return self._create_node(x, disc, y_code, idx, start, end, depth, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_node(x, disc, y_code, idx, start, end, depth, pool)
+        self.profiler.end(node)
+        return node
+
+    def _create_node(self, x, disc, y_code, idx, start, end, depth, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_subtree", rows, depth)
+            return pool.submit(self._create, x, disc, y_code, idx, start, end, depth)
+        class_num = len(np.unique(y_code[rows]))
+        if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res])
+
+        feature, threshold, is_discrete, children_codes = self._find_best_split(x, disc, y_code, rows, pool)
+        if feature is None:
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res])
+
+        if is_discrete:
+            major = Counter(y_code[rows]).most_common(1)[0][0]
+            col = disc[rows, self.disc_index[feature]]
+            bounds = self._partition_codes(idx, start, end, col, children_codes)
+            children = {}
+            for i, code in enumerate(children_codes):
+                val = self.categories[feature][code]
+                children[val] = self._create(x, disc, y_code, idx, bounds[i], bounds[i + 1], depth + 1, pool)
+            return Node(feature=feature, children=children, is_discrete=True, major=self.classes[major])
+        else:
+            mid = self._partition(idx, start, end, x[rows, feature] <= threshold)
+            left = self._create(x, disc, y_code, idx, start, mid, depth + 1, pool)
+            right = self._create(x, disc, y_code, idx, mid, end, depth + 1, pool)
+            return Node(feature=feature, threshold=threshold, left=left, right=right)
+
+    # 在 worker 进程里建 rows 对应的子树，x、disc、y_code 为共享内存里的完整数据，直接按下标划分
+    def _create_subtree(self, x, disc, y_code, rows, depth):
+        idx = rows.copy()
+        return self._create(x, disc, y_code, idx, 0, len(idx), depth)
+
+    # feature_types 可在构造时给出，fit 时传入则覆盖
+    def fit(self, x, y, feature_types=None):
+        x = np.array(x)
+        y = np.array(y)
+        if feature_types is not None:
+            self.feature_types = feature_types
+        if self.max_bins is None:
+            self.classes, y_code = np.unique(y, return_inverse=True)
+            disc = self._encode(x)
+            idx = np.arange(len(y_code))
+            with self._span("fit"), self._pool(x, disc, y_code) as pool:
+                self.root = self._resolve(self._create(x, disc, y_code, idx, 0, len(idx), 0, pool))
+            self.flat = FlatTree(self.root, self.categories)
+        else:
+            codes, bin_edges, bin_next = self._quantize(x)
+            self.fit_binned(codes, y, self.feature_types, bin_edges, bin_next)
+
+    # 离散特征在 fit 时一次编码为 0..取值数-1，categories[f] 为编码对应的原始取值
+    def _encode(self, x):
+        self.categories = [None] * x.shape[1]
+        self.disc_index = {}
+        discrete = [f for f, kind in enumerate(self.feature_types) if kind == "discrete"]
+        disc = np.empty((x.shape[0], len(discrete)), dtype=np.intp)
+        for j, feat_idx in enumerate(discrete):
+            self.categories[feat_idx], disc[:, j] = np.unique(x[:, feat_idx], return_inverse=True)
+            self.disc_index[feat_idx] = j
+        return disc
+
+    # 直方图模式：连续特征量化为至多 max_bins 个区间，离散特征直接编码为取值下标
+    # bin_next[f][b] 为训练集中大于 bin_edges[f][b] 的最小取值，用于取中点作阈值
+    def _quantize(self, x):
+        # 编码存为 uint8，至多 256 个取值（0..255）
+        if self.max_bins > 255:
+            raise ValueError("max_bins must be at most 255, got %d" % self.max_bins)
+        codes = np.empty(x.shape, dtype=np.uint8)
+        bin_edges = []
+        bin_next = []
+        for feat_idx in range(x.shape[1]):
+            col = x[:, feat_idx]
+            edges = np.unique(col)
+            next_values = None
+            if self.feature_types[feat_idx] == "continuous":
+                if len(edges) > self.max_bins:
+                    q = np.linspace(0, 1, self.max_bins + 1)[1:]
+                    edges = np.unique(np.quantile(col, q, method="inverted_cdf"))
+                values = np.unique(col)
+                next_values = values[np.searchsorted(values, edges[:-1], side="right")]
+            elif len(edges) > 256:
+                raise ValueError("discrete feature %d has %d distinct values, at most 256 fit in uint8 codes" % (feat_idx, len(edges)))
+            codes[:, feat_idx] = np.searchsorted(edges, col)
+            bin_edges.append(edges)
+            bin_next.append(next_values)
+        return codes, bin_edges, bin_next
+
+    def fit_binned(self, codes, y, feature_types, bin_edges, bin_next, hist=None):
+        y = np.array(y)
+        self.feature_types = feature_types
+        self.bin_edges = bin_edges
+        self.bin_next = bin_next
+        self.categories = [edges if kind == "discrete" else None for edges, kind in zip(bin_edges, feature_types)]
+        self.classes, y_code = np.unique(y, return_inverse=True)
+        if hist is None:
+            hist = self._histogram(codes, y_code)
+        idx = np.arange(len(y_code))
+        with self._span("fit"), self._pool(codes, y_code) as pool:
+            self.root = self._resolve(self._create_hist(codes, y_code, hist, idx, 0, len(idx), 0, pool))
+        self.flat = FlatTree(self.root, self.categories)
+
+    # rows（None 为全部行）的 (特征, 箱, 类别) 计数；逐列 bincount，临时数组只有 O(行数)，
+    # 不会生成 行数 × 特征数 的 intp 矩阵，codes 可以是按列存放的内存映射
+    def _histogram(self, codes, y_code, rows=None):
+        n = codes.shape[1]
+        bins = max(len(edges) for edges in self.bin_edges)
+        k = len(self.classes)
+        labels = y_code if rows is None else y_code[rows]
+        hist = np.empty((n, bins, k), dtype=np.int64)
+        for each_feature in range(n):
+            col = codes[:, each_feature] if rows is None else codes[rows, each_feature]
+            hist[each_feature] = np.bincount(col.astype(np.intp) * k + labels, minlength=bins * k).reshape(bins, k)
+        return hist
+
+    def _find_best_split_hist(self, hist, m):
+        best_gr = -1
+        best_feature = None
+        best_code = None
+        total = hist[0].sum(axis=0)
+        before = self._entropy_counts(total)
         for feat_idx in range(len(self.feature_types)):
+            h = hist[feat_idx]
             if self.feature_types[feat_idx] == "continuous":
-                col = x[:, feat_idx]
-                sorted_idx = np.argsort(col)
-                x_sorted = col[sorted_idx]
-                y_sorted = y[sorted_idx]
-
-                gr = -1
-                th = None
-                for i in range(1, len(x_sorted)):
-                    if y_sorted[i] != y_sorted[i - 1]: 
-                        threshold = (x_sorted[i] + x_sorted[i - 1]) / 2
-                        left_mask = col <= threshold
-                        y_left = y[left_mask]
-                        y_right = y[~left_mask]
-                        if len(y_left) == 0 or len(y_right) == 0:
-                            continue
-                        gain_ratio = self._gain_ratio_continuous(y, y_left, y_right)
-                        if gain_ratio > gr:
-                            gr = gain_ratio
-                            th = threshold
-                if gr > best_gr:
-                    best_gr = gr
-                    best_feature = feat_idx
-                    best_threshold = th
-                    best_is_discrete = False
-            else: 
-                col = x[:, feat_idx]
-                unique_vals = np.unique(col)
-                subsets = [y[col == val] for val in unique_vals]
-                if any(len(s) == 0 for s in subsets):
+                left = np.cumsum(h, axis=0)[:-1]
+                left_num = left.sum(axis=1)
+                valid = (left_num > 0) & (left_num < m)
+                if not valid.any():
                     continue
-                gain_ratio = self._gain_ratio_discrete(y, subsets)
+                left = left[valid]
+                if self.profiler is not None:
+                    self.profiler.add("candidates", len(left))
+                gain_ratio = self._gain_ratio_continuous(before, left, total - left)
+                i = np.argmax(gain_ratio)
+                if gain_ratio[i] > best_gr:
+                    best_gr = gain_ratio[i]
+                    best_feature = feat_idx
+                    best_code = np.flatnonzero(valid)[i]
+            else:
+                present = np.flatnonzero(h.sum(axis=1))
+                if self.profiler is not None:
+                    self.profiler.add("candidates")
+                gain_ratio = self._gain_ratio_discrete(before, h[present])
                 if gain_ratio > best_gr:
                     best_gr = gain_ratio
                     best_feature = feat_idx
-                    best_is_discrete = True
-                    best_children_vals = unique_vals
+                    best_code = present
+        if self.profiler is not None and best_feature is not None:
+            self.profiler.set(gain=float(best_gr))
+        return best_feature, best_code
 
-        return best_feature, best_threshold, best_is_discrete, best_children_vals
+    def _create_hist(self, codes, y_code, hist, idx, start, end, depth, pool=None):
+        if self.profiler is None:
+            return self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pool)
+        self.profiler.end(node)
+        return node
 
-    def _create(self, x, y, depth):
-        data_num = x.shape[0]
-        class_num = len(np.unique(y))
+    def _create_hist_node(self, codes, y_code, hist, idx, start, end, depth, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_hist_subtree", rows, hist, depth)
+            return pool.submit(self._create_hist, codes, y_code, hist, idx, start, end, depth)
+        class_num = np.count_nonzero(hist[0].sum(axis=0))
         if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
-            res = Counter(y).most_common(1)[0][0]
-            return Node(value=res)
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res])
 
-        feature, threshold, is_discrete, children_vals = self._find_best_split(x, y)
+        feature, code = self._find_best_split_hist(hist, data_num)
         if feature is None:
-            res = Counter(y).most_common(1)[0][0]
-            return Node(value=res)
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res])
 
-        if is_discrete:
-            col = x[:, feature]
+        col = codes[rows, feature]
+        if self.feature_types[feature] == "discrete":
+            major = Counter(y_code[rows]).most_common(1)[0][0]
+            bounds = self._partition_codes(idx, start, end, col.astype(np.intp), code)
+            # 最大的子节点直方图由父节点减去其余子节点得到
+            largest = np.argmax(np.diff(bounds))
+            hists = [None] * len(code)
+            for i in range(len(code)):
+                if i != largest:
+                    child_rows = idx[bounds[i]:bounds[i + 1]]
+                    hists[i] = self._histogram(codes, y_code, child_rows)
+            hists[largest] = hist - sum(h for h in hists if h is not None)
             children = {}
-            for val in children_vals:
-                mask = col == val
-                x_child = x[mask]
-                y_child = y[mask]
-                if len(y_child) == 0:
-                    child = Node(value=Counter(y).most_common(1)[0][0])
-                else:
-                    child = self._create(x_child, y_child, depth + 1)
-                children[val] = child
-            return Node(feature=feature, children=children, is_discrete=True)
+            for i, c in enumerate(code):
+                val = self.categories[feature][c]
+                children[val] = self._create_hist(codes, y_code, hists[i], idx, bounds[i], bounds[i + 1], depth + 1, pool)
+            return Node(feature=feature, children=children, is_discrete=True, major=self.classes[major])
         else:
-            left_mask = x[:, feature] <= threshold
-            right_mask = ~left_mask
-            left = self._create(x[left_mask], y[left_mask], depth + 1)
-            right = self._create(x[right_mask], y[right_mask], depth + 1)
+            threshold = (self.bin_edges[feature][code] + self.bin_next[feature][code]) / 2
+            mid = self._partition(idx, start, end, col <= code)
+            left_rows, right_rows = idx[start:mid], idx[mid:end]
+            if (mid - start) * 2 <= data_num:
+                left_hist = self._histogram(codes, y_code, left_rows)
+                right_hist = hist - left_hist
+            else:
+                right_hist = self._histogram(codes, y_code, right_rows)
+                left_hist = hist - right_hist
+            left = self._create_hist(codes, y_code, left_hist, idx, start, mid, depth + 1, pool)
+            right = self._create_hist(codes, y_code, right_hist, idx, mid, end, depth + 1, pool)
             return Node(feature=feature, threshold=threshold, left=left, right=right)
 
-    def fit(self, x, y, feature_types):
-        x = np.array(x)
-        y = np.array(y)
-        self.feature_types = feature_types
-        self.root = self._create(x, y, 0)
+    # 在 worker 进程里建 rows 对应的子树，codes 和 y_code 为共享内存里的完整数据，直接按下标划分
+    def _create_hist_subtree(self, codes, y_code, rows, hist, depth):
+        idx = rows.copy()
+        return self._create_hist(codes, y_code, hist, idx, 0, len(idx), depth)
 
     def _search(self, x, node):
         if node.is_leaf():
@@ -150,8 +535,7 @@ class C45:
             if val in node.children:
                 return self._search(x, node.children[val])
             else:
-                preds = [self._search(x, child) for child in node.children.values()]
-                return Counter(preds).most_common(1)[0][0]
+                return node.major
         else:
             if x[node.feature] <= node.threshold:
                 return self._search(x, node.left)
@@ -159,40 +543,38 @@ class C45:
                 return self._search(x, node.right)
 
     def predict(self, x):
-        return [self._search(each, self.root) for each in x]
-
-
-df = pd.read_csv("heartdisease.csv")
-data = df.to_numpy()
-tot = data.shape[0]
-feature_types = [
-    "continuous",  # age
-    "discrete",  # sex
-    "discrete",  # cp
-    "continuous",  # trestbps
-    "continuous",  # chol
-    "discrete",  # fbs
-    "discrete",  # restecg
-    "continuous",  # thalach
-    "discrete",  # exang
-    "continuous",  # oldpeak
-    "discrete",  # slope
-    "discrete",  # ca
-    "discrete",  # thal
-]
-
-
-for EPOCH in range(20):
-    indices = np.random.permutation(tot)
-    r = 0.2
-    test_len = int(r * tot)
-    test_x = data[indices[:test_len], :-1]
-    train_x = data[indices[test_len:], :-1]
-    test_y = data[indices[:test_len], -1]
-    train_y = data[indices[test_len:], -1]
-
-    tree = C45(min_samples_split=2, max_depth=10)
-    tree.fit(train_x, train_y, feature_types) 
-    predictions = tree.predict(test_x)
-    res = sum(p == t for p, t in zip(predictions, test_y)) / test_len * 100
-    print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
+        x = np.asarray(x)
+        if self.profiler is None:
+            return self.flat.classes[self.flat.value[self.flat.route(x)]]
+        with self.profiler.span("predict"):
+            lengths = np.zeros(len(x), dtype=np.intp)
+            res = self.flat.classes[self.flat.value[self.flat.route(x, lengths)]]
+        self.profiler.paths(lengths)
+        return res
+
+
+if __name__ == "__main__":
+    from functools import partial
+    from experiment import run
+
+    df = pd.read_csv("heartdisease.csv")
+    data = df.to_numpy()
+    feature_types = [
+        "continuous",  # age
+        "discrete",  # sex
+        "discrete",  # cp
+        "continuous",  # trestbps
+        "continuous",  # chol
+        "discrete",  # fbs
+        "discrete",  # restecg
+        "continuous",  # thalach
+        "discrete",  # exang
+        "continuous",  # oldpeak
+        "discrete",  # slope
+        "discrete",  # ca
+        "discrete",  # thal
+    ]
+
+    result = run(partial(C45, min_samples_split=2, max_depth=10, feature_types=feature_types), data, test_ratio=0.2, epochs=20)
+    for EPOCH, res in enumerate(result["acc"]):
+        print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
@@ -1,76 +1,429 @@
+import copy
+import os
 import numpy as np
 from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import chain, repeat
 import pandas as pd
+from sharedmem import attach, share
 
 
 class Node:
+    __slots__ = ("feature", "threshold", "left", "right", "value", "n_samples", "major")
 
-    def __init__(self, feature=None, threshold=None, left=None, right=None, value=None):
+    # n_samples 和 major 为到达该节点的训练样本数及其多数类，截断成更浅或更大 min_samples_split 的树时用作叶子
+    def __init__(self, feature=None, threshold=None, left=None, right=None, value=None, n_samples=0, major=None):
         self.feature = feature
         self.threshold = threshold
         self.left = left
         self.right = right
         self.value = value
+        self.n_samples = n_samples
+        self.major = value if major is None else major
 
     def is_leaf(self):
         return self.value is not None
 
 
+# fit 之后把链式 Node 编译成并列数组：feature[i] < 0 表示叶子，value[i] 为叶子类别在 classes 中的下标
+class FlatTree:
+    __slots__ = ("feature", "threshold", "left", "right", "value", "classes")
+
+    def __init__(self, root: Node):
+        nodes = [root]
+        for node in nodes:
+            if not node.is_leaf():
+                nodes += [node.left, node.right]
+        ids = {id(node): i for i, node in enumerate(nodes)}
+        self.classes = np.unique([node.value for node in nodes if node.is_leaf()])
+        size = len(nodes)
+        self.feature = np.full(size, -1, dtype=np.intp)
+        self.threshold = np.zeros(size)
+        self.left = np.full(size, -1, dtype=np.intp)
+        self.right = np.full(size, -1, dtype=np.intp)
+        self.value = np.full(size, -1, dtype=np.intp)
+        for i, node in enumerate(nodes):
+            if node.is_leaf():
+                self.value[i] = np.searchsorted(self.classes, node.value)
+            else:
+                self.feature[i] = node.feature
+                self.threshold[i] = node.threshold
+                self.left[i] = ids[id(node.left)]
+                self.right[i] = ids[id(node.right)]
+
+    # 整批样本逐层下推，每层一次向量化比较，共 O(depth) 步；给出 lengths 时累加每行经过的内部节点数
+    def predict(self, x, lengths=None):
+        node = np.zeros(len(x), dtype=np.intp)
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while len(active):
+            if lengths is not None:
+                lengths[active] += 1
+            cur = node[active]
+            go_right = x[active, self.feature[cur]] > self.threshold[cur]
+            nxt = np.where(go_right, self.right[cur], self.left[cur])
+            node[active] = nxt
+            active = active[self.feature[nxt] >= 0]
+        return self.classes[self.value[node]]
+
+
+# 进程后端的 worker：建树开始时训练数据放进共享内存，worker 进程初始化时映射一次，同时收到一份不带训练结果
+# 和 profiler 的模型副本；之后每个任务只传方法名、行下标和特征号等少量参数，由 _worker_call 在副本上调用
+_model = None
+_data = None
+# 进程后端下样本数少于此值的节点不分发特征扫描
+PROCESS_MIN_ROWS = 2000
+
+
+def _worker_init(model, *specs):
+    global _model, _data
+    _model = model
+    _data = attach(*specs)
+
+
+def _worker_call(name, *args):
+    return getattr(_model, name)(*_data, *args)
+
+
 class DecisionTree:
-    def __init__(self, min_samples_split=2, max_depth=10):
+    def __init__(
+        self,
+        min_samples_split=2,
+        max_depth=10,
+        max_bins=None,
+        n_jobs=1,
+        backend="thread",
+        subtree_cutoff=0,
+        max_features=None,
+        random_state=None,
+        profiler=None,
+    ):
         self.min_samples_split = min_samples_split
         self.max_depth = max_depth
+        self.max_bins = max_bins
+        # max_features 不为 None 时每个节点只在随机抽取的部分特征里找分割点（随机森林用）
+        # 可取整数、比例、"sqrt" 或 "log2"；每个节点的抽样只由本次 fit 的种子和节点编号决定，与 worker 数和建树顺序无关
+        self.max_features = max_features
+        self.random_state = random_state
+        self.seed = None
+        # 可选的 profiling.Profiler，None 时不做任何记录
+        self.profiler = profiler
+        # n_jobs > 1 时按特征并行搜索分割点；样本数不超过 subtree_cutoff 的子树整棵交给一个 worker
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.backend = backend
+        self.subtree_cutoff = subtree_cutoff
         self.root = None
+        self.flat = None
+        self.bin_edges = None
 
     def fit(self, x, y):
         x = np.array(x)
         y = np.array(y)
-        self.root = self._create(x, y, 0)
+        if self.max_bins is None:
+            self.seed = self._draw_seed()
+            idx = np.arange(len(y))
+            # 进程后端只把标签编码放进共享内存，worker 用 classes 还原标签
+            self.classes, y_code = np.unique(y, return_inverse=True)
+            with self._span("fit"), self._pool(x, y_code) as pool:
+                self.root = self._resolve(self._create(x, y, idx, 0, len(idx), 0, 1, pool))
+            self.flat = FlatTree(self.root)
+        else:
+            codes, bin_edges = self._quantize(x)
+            self.fit_binned(codes, y, bin_edges)
+
+    # 直方图模式：每列只量化一次，codes[i, f] = b 表示 bin_edges[f][b-1] < x[i, f] <= bin_edges[f][b]
+    def _quantize(self, x):
+        # 编码存为 uint8，至多 256 个取值（0..255）
+        if self.max_bins > 255:
+            raise ValueError("max_bins must be at most 255, got %d" % self.max_bins)
+        codes = np.empty(x.shape, dtype=np.uint8)
+        bin_edges = []
+        for each_feature in range(x.shape[1]):
+            col = x[:, each_feature]
+            edges = np.unique(col)
+            if len(edges) > self.max_bins:
+                q = np.linspace(0, 1, self.max_bins + 1)[1:]
+                edges = np.unique(np.quantile(col, q, method="inverted_cdf"))
+            codes[:, each_feature] = np.searchsorted(edges, col)
+            bin_edges.append(edges)
+        return codes, bin_edges
+
+    def fit_binned(self, codes, y, bin_edges, hist=None):
+        y = np.array(y)
+        self.seed = self._draw_seed()
+        self.bin_edges = bin_edges
+        self.classes, y_code = np.unique(y, return_inverse=True)
+        if hist is None:
+            hist = self._histogram(codes, y_code)
+        idx = np.arange(len(y_code))
+        with self._span("fit"), self._pool(codes, y_code) as pool:
+            self.root = self._resolve(self._create_hist(codes, y_code, hist, idx, 0, len(idx), 0, 1, pool))
+        self.flat = FlatTree(self.root)
+
+    # rows（None 为全部行）的 (特征, 箱, 类别) 计数；逐列 bincount，临时数组只有 O(行数)，
+    # 不会生成 行数 × 特征数 的 intp 矩阵，codes 可以是按列存放的内存映射
+    def _histogram(self, codes, y_code, rows=None):
+        n = codes.shape[1]
+        bins = max(len(edges) for edges in self.bin_edges)
+        k = len(self.classes)
+        labels = y_code if rows is None else y_code[rows]
+        hist = np.empty((n, bins, k), dtype=np.int64)
+        for each_feature in range(n):
+            col = codes[:, each_feature] if rows is None else codes[rows, each_feature]
+            hist[each_feature] = np.bincount(col.astype(np.intp) * k + labels, minlength=bins * k).reshape(bins, k)
+        return hist
+
+    def _gini(self, cnt, tot):
+        return 1 - np.sum((cnt / tot[..., None]) ** 2, axis=1)
+
+    # 返回 (最小加权 gini, 阈值, 候选阈值数)；候选数交给调用方记录，worker 线程里没有当前节点
+    def _scan_feature(self, col, one_hot, total):
+        m = len(col)
+        order = np.argsort(col, kind="stable")
+        col = col[order]
+        # 候选阈值为相邻不同取值中的较小者，左子树为 col <= col[pos]
+        pos = np.flatnonzero(col[:-1] != col[1:])
+        if len(pos) == 0:
+            return float("inf"), None, 0
+        left_cnt = np.cumsum(one_hot[order], axis=0)[pos]
+        right_cnt = total - left_cnt
+        left_num = pos + 1
+        right_num = m - left_num
+        w_gini = (left_num * self._gini(left_cnt, left_num) + right_num * self._gini(right_cnt, right_num)) / m
+        best = np.argmin(w_gini)
+        return w_gini[best], col[pos[best]], len(pos)
+
+    # random_state 为同一个 Generator 时（随机森林）每次 fit 从中取一个新种子，否则同一 random_state 每次 fit 结果相同
+    def _draw_seed(self):
+        return int(np.random.default_rng(self.random_state).integers(2**63))
+
+    # 本节点参与比较的特征，升序排列以保持按特征序的平局规则；None 表示全部特征
+    # pos 为节点在完全二叉树中的编号（根为 1，左右子节点为 2pos、2pos+1），由 (seed, pos) 建本节点的随机数发生器
+    def _sample_features(self, n, pos):
+        if self.max_features is None:
+            return None
+        if self.max_features == "sqrt":
+            k = int(np.sqrt(n))
+        elif self.max_features == "log2":
+            k = int(np.log2(n))
+        elif isinstance(self.max_features, float):
+            k = int(self.max_features * n)
+        else:
+            k = self.max_features
+        k = min(max(k, 1), n)
+        rng = np.random.default_rng([self.seed, pos])
+        return np.sort(rng.choice(n, k, replace=False)).tolist()
 
-    def _gini(self, y):
-        cnt = Counter(y)
-        tot = len(y)
-        return 1 - sum((count / tot) ** 2 for count in cnt.values())
+    # 节点内标签的 one-hot 矩阵和类别计数，列按节点内出现的标签排序
+    def _one_hot(self, labels):
+        _, y_code = np.unique(labels, return_inverse=True)
+        one_hot = np.zeros((len(labels), y_code.max() + 1), dtype=np.int64)
+        one_hot[np.arange(len(labels)), y_code] = 1
+        return one_hot, one_hot.sum(axis=0)
 
-    def _find_threshold(self, x, y):
+    # 进程后端的一个任务：在 worker 里由共享的 x 和标签编码取出本节点的列，依次扫描 feats
+    def _scan_features(self, x, y_code, rows, feats):
+        one_hot, total = self._one_hot(y_code[rows])
+        return [self._scan_feature(x[rows, each_feature], one_hot, total) for each_feature in feats]
+
+    def _find_threshold(self, x, y, rows, pos, pool=None):
         gini = float("inf")
         feature = None
         threshold = None
-        m, n = x.shape
-        for each_feature in range(n):
-            thresholds = np.unique(x[:, each_feature])
-            for each_threshold in thresholds:
-                left_mask = x[:, each_feature] <= each_threshold
-                right_mask = ~left_mask
-                if np.sum(left_mask) == 0 or np.sum(right_mask) == 0:
-                    continue
-                gini_left = self._gini(y[left_mask])
-                gini_right = self._gini(y[right_mask])
-                w_gini = (np.sum(left_mask) * gini_left + np.sum(right_mask) * gini_right) / m
-                if w_gini < gini:
-                    gini = w_gini
-                    feature = each_feature
-                    threshold = each_threshold
+        m, n = len(rows), x.shape[1]
+        one_hot, total = self._one_hot(y[rows])
+        feats = self._sample_features(n, pos)
+        if feats is None:
+            feats = range(n)
+        # 小节点的扫描比一次进程间往返还便宜，留在主进程里做
+        if pool is None or (self.backend == "process" and m < PROCESS_MIN_ROWS):
+            cols = (x[rows, each_feature] for each_feature in feats)
+            results = map(self._scan_feature, cols, repeat(one_hot), repeat(total))
+        elif self.backend == "process":
+            # 特征分成 n_jobs 块，每块一个任务，行下标每块只传一次
+            chunks = [chunk for chunk in np.array_split(np.asarray(feats), self.n_jobs) if len(chunk)]
+            results = chain.from_iterable(pool.map(_worker_call, repeat("_scan_features"), repeat(rows), chunks))
+        else:
+            cols = (x[rows, each_feature] for each_feature in feats)
+            results = pool.map(self._scan_feature, cols, repeat(one_hot), repeat(total))
+        # 结果按特征顺序归并，严格小于才更新，与 worker 数无关
+        candidates = 0
+        for each_feature, (w_gini, each_threshold, n_candidates) in zip(feats, results):
+            candidates += n_candidates
+            if w_gini < gini:
+                gini = w_gini
+                feature = each_feature
+                threshold = each_threshold
+        if self.profiler is not None:
+            self.profiler.add("candidates", candidates)
+            self.profiler.add("bytes_copied", m * len(feats) * x.itemsize + one_hot.nbytes)
+            if feature is not None:
+                self.profiler.set(gain=float(self._gini(total[None], np.array([m]))[0] - gini))
         return feature, threshold
 
-    def _create(self, x, y, depth):
-        data_num = x.shape[0]
-        class_num = len(np.unique(y))
+    def _span(self, name):
+        return nullcontext() if self.profiler is None else self.profiler.span(name)
+
+    # arrays 为进程后端要放进共享内存的训练数据；池先于共享内存关闭
+    @contextmanager
+    def _pool(self, *arrays):
+        if self.n_jobs <= 1:
+            yield None
+        elif self.backend == "process":
+            with share(*arrays) as specs:
+                with ProcessPoolExecutor(self.n_jobs, initializer=_worker_init, initargs=(self._worker_model(), *specs)) as pool:
+                    yield pool
+        else:
+            with ThreadPoolExecutor(self.n_jobs) as pool:
+                yield pool
+
+    # 发给 worker 进程的模型副本：不带上一次的训练结果和 profiler，在 worker 里串行建树
+    def _worker_model(self):
+        model = copy.copy(self)
+        model.root = model.flat = model.profiler = None
+        model.n_jobs = 1
+        return model
+
+    # 把交给 worker 的子树（Future）替换为建好的节点
+    def _resolve(self, node):
+        if isinstance(node, Future):
+            return node.result()
+        if not node.is_leaf():
+            node.left = self._resolve(node.left)
+            node.right = self._resolve(node.right)
+        return node
+
+    # 按 mask 把 idx[start:end] 稳定地划分为左右两段，返回分界位置；稳定划分保证样本相对次序与拷贝子数组时一致
+    def _partition(self, idx, start, end, mask):
+        rows = idx[start:end]
+        left, right = rows[mask], rows[~mask]
+        if self.profiler is not None:
+            self.profiler.add("masks", 2)
+            self.profiler.add("bytes_copied", 2 * mask.nbytes + rows.nbytes)
+        mid = start + len(left)
+        idx[start:mid] = left
+        idx[mid:end] = right
+        return mid
+
+    # 与 Counter(labels).most_common(1) 相同：出现次数最多的取值，平票取先出现的
+    def _majority(self, labels):
+        vals, first, counts = np.unique(labels, return_index=True, return_counts=True)
+        top = np.flatnonzero(counts == counts.max())
+        return vals[top[np.argmin(first[top])]]
+
+    def _create(self, x, y, idx, start, end, depth, pos, pool=None):
+        if self.profiler is None:
+            return self._create_node(x, y, idx, start, end, depth, pos, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_node(x, y, idx, start, end, depth, pos, pool)
+        self.profiler.end(node)
+        return node
+
+    def _create_node(self, x, y, idx, start, end, depth, pos, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_subtree", rows, depth, pos)
+            return pool.submit(self._create, x, y, idx, start, end, depth, pos)
+        class_num = len(np.unique(y[rows]))
         if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
-            res = Counter(y).most_common(1)[0][0]
-            return Node(value=res)
-        feature, threshold = self._find_threshold(x, y)
+            res = Counter(y[rows]).most_common(1)[0][0]
+            return Node(value=res, n_samples=data_num)
+        feature, threshold = self._find_threshold(x, y, rows, pos, pool)
         if feature is None:
-            res = Counter(y).most_common(1)[0][0]
-            return Node(value=res)
-        left_mask = x[:, feature] <= threshold
-        right_mask = ~left_mask
-        left = self._create(x[left_mask], y[left_mask], depth + 1)
-        right = self._create(x[right_mask], y[right_mask], depth + 1)
-        return Node(feature=feature, threshold=threshold, left=left, right=right)
+            res = Counter(y[rows]).most_common(1)[0][0]
+            return Node(value=res, n_samples=data_num)
+        major = self._majority(y[rows])
+        mid = self._partition(idx, start, end, x[rows, feature] <= threshold)
+        left = self._create(x, y, idx, start, mid, depth + 1, 2 * pos, pool)
+        right = self._create(x, y, idx, mid, end, depth + 1, 2 * pos + 1, pool)
+        return Node(feature=feature, threshold=threshold, left=left, right=right, n_samples=data_num, major=major)
+
+    # 在 worker 进程里建 rows 对应的子树，x 和 y_code 为共享内存里的完整数据
+    def _create_subtree(self, x, y_code, rows, depth, pos):
+        idx = np.arange(len(rows))
+        return self._create(x[rows], self.classes[y_code[rows]], idx, 0, len(idx), depth, pos)
+
+    def _find_threshold_hist(self, hist, m):
+        left_cnt = np.cumsum(hist, axis=1)
+        right_cnt = left_cnt[:, -1:] - left_cnt
+        left_num = left_cnt.sum(axis=2)
+        right_num = m - left_num
+        valid = (left_num > 0) & (right_num > 0)
+        if not valid.any():
+            return None, None
+        w_gini = np.full(left_num.shape, np.inf)
+        w_gini[valid] = (
+            left_num[valid] * self._gini(left_cnt[valid], left_num[valid])
+            + right_num[valid] * self._gini(right_cnt[valid], right_num[valid])
+        ) / m
+        # 与 _find_threshold 相同的平局规则：先特征序，再阈值序
+        feature, b = np.unravel_index(np.argmin(w_gini), w_gini.shape)
+        if self.profiler is not None:
+            self.profiler.add("candidates", np.count_nonzero(valid))
+            total = left_cnt[0, -1]
+            self.profiler.set(gain=float(self._gini(total[None], np.array([m]))[0] - w_gini[feature, b]))
+        return int(feature), int(b)
+
+    def _create_hist(self, codes, y_code, hist, idx, start, end, depth, pos, pool=None):
+        if self.profiler is None:
+            return self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pos, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pos, pool)
+        self.profiler.end(node)
+        return node
+
+    def _create_hist_node(self, codes, y_code, hist, idx, start, end, depth, pos, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_hist_subtree", rows, hist, depth, pos)
+            return pool.submit(self._create_hist, codes, y_code, hist, idx, start, end, depth, pos)
+        class_num = np.count_nonzero(hist[0].sum(axis=0))
+        if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res], n_samples=data_num)
+        feats = self._sample_features(hist.shape[0], pos)
+        if feats is None:
+            feature, b = self._find_threshold_hist(hist, data_num)
+        else:
+            feature, b = self._find_threshold_hist(hist[feats], data_num)
+            if feature is not None:
+                feature = int(feats[feature])
+        if feature is None:
+            res = Counter(y_code[rows]).most_common(1)[0][0]
+            return Node(value=self.classes[res], n_samples=data_num)
+        major = self.classes[self._majority(y_code[rows])]
+        mid = self._partition(idx, start, end, codes[rows, feature] <= b)
+        left_rows, right_rows = idx[start:mid], idx[mid:end]
+        # 只统计较小子节点的直方图，兄弟节点的直方图由父节点相减得到
+        if (mid - start) * 2 <= data_num:
+            left_hist = self._histogram(codes, y_code, left_rows)
+            right_hist = hist - left_hist
+        else:
+            right_hist = self._histogram(codes, y_code, right_rows)
+            left_hist = hist - right_hist
+        if self.profiler is not None:
+            self.profiler.add("bytes_copied", min(mid - start, end - mid) * codes.shape[1] * codes.itemsize + 2 * hist.nbytes)
+        left = self._create_hist(codes, y_code, left_hist, idx, start, mid, depth + 1, 2 * pos, pool)
+        right = self._create_hist(codes, y_code, right_hist, idx, mid, end, depth + 1, 2 * pos + 1, pool)
+        return Node(feature=feature, threshold=self.bin_edges[feature][b], left=left, right=right, n_samples=data_num, major=major)
+
+    # 在 worker 进程里建 rows 对应的子树，codes 和 y_code 为共享内存里的完整数据，直接按下标划分
+    def _create_hist_subtree(self, codes, y_code, rows, hist, depth, pos):
+        idx = rows.copy()
+        return self._create_hist(codes, y_code, hist, idx, 0, len(idx), depth, pos)
 
     def predict(self, x):
-        return [self._search(each, self.root) for each in x]
+        if self.profiler is None:
+            return self.flat.predict(np.asarray(x))
+        with self.profiler.span("predict"):
+            lengths = np.zeros(len(x), dtype=np.intp)
+            res = self.flat.predict(np.asarray(x), lengths)
+        self.profiler.paths(lengths)
+        return res
 
     def _search(self, x, tree: Node):
         if tree.is_leaf():
@@ -81,20 +434,12 @@ class DecisionTree:
             return self._search(x, tree.left)
 
 
-df = pd.read_csv("heartdisease.csv")
-data = df.to_numpy()
-tot = data.shape[0]
-for EPOCH in range(20):
-    indices = np.random.permutation(tot)
-    r = 0.2
-    test_len = int(r * tot)
-    test_x = data[indices[:test_len], :-1]
-    train_x = data[indices[test_len:], :-1]
-    test_y = data[indices[:test_len], -1]
-    train_y = data[indices[test_len:], -1]
-
-    tree = DecisionTree(min_samples_split=2, max_depth=10)
-    tree.fit(train_x, train_y)
-    predictions = tree.predict(test_x)
-    res = sum([1 if predictions[i] == test_y[i] else 0 for i in range(test_len)]) / test_len * 100
-    print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
+if __name__ == "__main__":
+    from functools import partial
+    from experiment import run
+
+    df = pd.read_csv("heartdisease.csv")
+    data = df.to_numpy()
+    result = run(partial(DecisionTree, min_samples_split=2, max_depth=10), data, test_ratio=0.2, epochs=20)
+    for EPOCH, res in enumerate(result["acc"]):
+        print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
@@ -1,97 +1,565 @@
+import copy
+import heapq
+import os
 import numpy as np
 from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import chain, repeat
 import pandas as pd
+from sharedmem import attach, share
 
 
 class Node:
+    __slots__ = ("feature", "threshold", "left", "right", "value", "major", "n_samples", "n_errors", "alpha")
 
-    def __init__(self, feature=None, threshold=None, left=None, right=None, value=None, major=None):
+    # n_errors 为该节点塌缩成 major 叶子时误分的训练样本数；alpha 为代价复杂度剪枝中该节点被剪成叶子时的 alpha
+    def __init__(self, feature=None, threshold=None, left=None, right=None, value=None, major=None, n_samples=0, n_errors=0):
         self.feature = feature
         self.threshold = threshold
         self.left = left
         self.right = right
         self.value = value
         self.major = major
+        self.n_samples = n_samples
+        self.n_errors = n_errors
+        self.alpha = np.inf
 
     def is_leaf(self):
         return self.value is not None
 
 
+# fit 之后把链式 Node 编译成并列数组：feature[i] < 0 表示叶子，value[i] 为叶子类别在 classes 中的下标
+# 给出 alpha 时 node.alpha <= alpha 的节点按 major 当作叶子，即代价复杂度剪枝后的子树，原树不变
+class FlatTree:
+    __slots__ = ("feature", "threshold", "left", "right", "value", "classes")
+
+    def __init__(self, root: Node, alpha=None):
+        def is_leaf(node):
+            return node.is_leaf() or (alpha is not None and node.alpha <= alpha)
+
+        nodes = [root]
+        for node in nodes:
+            if not is_leaf(node):
+                nodes += [node.left, node.right]
+        ids = {id(node): i for i, node in enumerate(nodes)}
+        self.classes = np.unique([node.major for node in nodes if is_leaf(node)])
+        size = len(nodes)
+        self.feature = np.full(size, -1, dtype=np.intp)
+        self.threshold = np.zeros(size)
+        self.left = np.full(size, -1, dtype=np.intp)
+        self.right = np.full(size, -1, dtype=np.intp)
+        self.value = np.full(size, -1, dtype=np.intp)
+        for i, node in enumerate(nodes):
+            if is_leaf(node):
+                self.value[i] = np.searchsorted(self.classes, node.major)
+            else:
+                self.feature[i] = node.feature
+                self.threshold[i] = node.threshold
+                self.left[i] = ids[id(node.left)]
+                self.right[i] = ids[id(node.right)]
+
+    # 整批样本逐层下推，每层一次向量化比较，共 O(depth) 步；给出 lengths 时累加每行经过的内部节点数
+    def predict(self, x, lengths=None):
+        node = np.zeros(len(x), dtype=np.intp)
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while len(active):
+            if lengths is not None:
+                lengths[active] += 1
+            cur = node[active]
+            go_right = x[active, self.feature[cur]] > self.threshold[cur]
+            nxt = np.where(go_right, self.right[cur], self.left[cur])
+            node[active] = nxt
+            active = active[self.feature[nxt] >= 0]
+        return self.classes[self.value[node]]
+
+
+# 交叉验证的 worker：训练数据放在模块级变量里，多进程时由共享内存映射得到
+_cv_x = None
+_cv_y = None
+
+
+def _cv_init(x, y):
+    global _cv_x, _cv_y
+    _cv_x, _cv_y = x, y
+
+
+def _cv_attach(x_spec, y_spec):
+    _cv_init(*attach(x_spec, y_spec))
+
+
+def _cv_fold(params, train_idx, test_idx, candidates):
+    tree = DecisionTree(**params)
+    tree.fit(_cv_x[train_idx], _cv_y[train_idx])
+    errors = np.zeros(len(candidates))
+    for i, alpha in enumerate(candidates):
+        tree.prune(alpha)
+        errors[i] = np.count_nonzero(tree.predict(_cv_x[test_idx]) != _cv_y[test_idx])
+    return errors
+
+
+# 进程后端的 worker：建树开始时训练数据放进共享内存，worker 进程初始化时映射一次，同时收到一份不带训练结果
+# 和 profiler 的模型副本；之后每个任务只传方法名、行下标和特征号等少量参数，由 _worker_call 在副本上调用
+_model = None
+_data = None
+# 进程后端下样本数少于此值的节点不分发特征扫描
+PROCESS_MIN_ROWS = 2000
+
+
+def _worker_init(model, *specs):
+    global _model, _data
+    _model = model
+    _data = attach(*specs)
+
+
+def _worker_call(name, *args):
+    return getattr(_model, name)(*_data, *args)
+
+
 class DecisionTree:
-    def __init__(self, min_samples_split=2, max_depth=10):
+    def __init__(self, min_samples_split=2, max_depth=10, max_bins=None, n_jobs=1, backend="thread", subtree_cutoff=0, profiler=None):
         self.min_samples_split = min_samples_split
         self.max_depth = max_depth
+        self.max_bins = max_bins
+        # n_jobs > 1 时按特征并行搜索分割点；样本数不超过 subtree_cutoff 的子树整棵交给一个 worker
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.backend = backend
+        self.subtree_cutoff = subtree_cutoff
+        # 可选的 profiling.Profiler，None 时不做任何记录；剪枝分别记在 "post_prune" 和 "ccp_path" 两个计时里
+        self.profiler = profiler
         self.root = None
+        self.flat = None
+        self.bin_edges = None
+        self.ccp_alphas = None
+        self.ccp_impurities = None
+        self.ccp_n_leaves = None
+        self.alpha = None
+        self.cv_errors = None
 
-    def fit(self, x, y):
+    # 给出验证集时建树后直接做后剪枝
+    def fit(self, x, y, eval_x=None, eval_y=None):
         x = np.array(x)
         y = np.array(y)
-        self.root = self._create(x, y, 0)
+        if self.max_bins is None:
+            idx = np.arange(len(y))
+            # 进程后端只把标签编码放进共享内存，worker 用 classes 还原标签
+            self.classes, y_code = np.unique(y, return_inverse=True)
+            with self._span("fit"), self._pool(x, y_code) as pool:
+                self.root = self._resolve(self._create(x, y, idx, 0, len(idx), 0, pool))
+            self.flat = FlatTree(self.root)
+            self.cost_complexity_path()
+        else:
+            codes, bin_edges = self._quantize(x)
+            self.fit_binned(codes, y, bin_edges)
+        if eval_x is not None:
+            self.post_prune(self.root, eval_x, eval_y)
 
-    def _eval(self, tree, vx, vy):
-        return sum([1 if self._search(vx[i], tree) == vy[i] else 0 for i in range(len(vy))]) / len(vy)
+    # 直方图模式：每列只量化一次，codes[i, f] = b 表示 bin_edges[f][b-1] < x[i, f] <= bin_edges[f][b]
+    def _quantize(self, x):
+        # 编码存为 uint8，至多 256 个取值（0..255）
+        if self.max_bins > 255:
+            raise ValueError("max_bins must be at most 255, got %d" % self.max_bins)
+        codes = np.empty(x.shape, dtype=np.uint8)
+        bin_edges = []
+        for each_feature in range(x.shape[1]):
+            col = x[:, each_feature]
+            edges = np.unique(col)
+            if len(edges) > self.max_bins:
+                q = np.linspace(0, 1, self.max_bins + 1)[1:]
+                edges = np.unique(np.quantile(col, q, method="inverted_cdf"))
+            codes[:, each_feature] = np.searchsorted(edges, col)
+            bin_edges.append(edges)
+        return codes, bin_edges
+
+    def fit_binned(self, codes, y, bin_edges, hist=None):
+        y = np.array(y)
+        self.bin_edges = bin_edges
+        self.classes, y_code = np.unique(y, return_inverse=True)
+        if hist is None:
+            hist = self._histogram(codes, y_code)
+        idx = np.arange(len(y_code))
+        with self._span("fit"), self._pool(codes, y_code) as pool:
+            self.root = self._resolve(self._create_hist(codes, y_code, hist, idx, 0, len(idx), 0, pool))
+        self.flat = FlatTree(self.root)
+        self.cost_complexity_path()
+
+    # rows（None 为全部行）的 (特征, 箱, 类别) 计数；逐列 bincount，临时数组只有 O(行数)，
+    # 不会生成 行数 × 特征数 的 intp 矩阵，codes 可以是按列存放的内存映射
+    def _histogram(self, codes, y_code, rows=None):
+        n = codes.shape[1]
+        bins = max(len(edges) for edges in self.bin_edges)
+        k = len(self.classes)
+        labels = y_code if rows is None else y_code[rows]
+        hist = np.empty((n, bins, k), dtype=np.int64)
+        for each_feature in range(n):
+            col = codes[:, each_feature] if rows is None else codes[rows, each_feature]
+            hist[each_feature] = np.bincount(col.astype(np.intp) * k + labels, minlength=bins * k).reshape(bins, k)
+        return hist
 
     def post_prune(self, tree: Node, vx, vy):
+        with self._span("post_prune"):
+            self._prune(tree, np.asarray(vx), np.asarray(vy))
+        self.flat = FlatTree(self.root)
+        self.cost_complexity_path()
+
+    # 自底向上一次遍历，返回剪枝后的子树对每个验证样本是否预测正确；
+    # 与原先一样比较的是整个验证集上"保留子树"和"塌缩为 major"的正确数，但每个节点只做一次向量化比较
+    def _prune(self, tree: Node, vx, vy):
         if tree.is_leaf():
-            return
-        if tree.left:
-            self.post_prune(tree.left, vx, vy)
-        if tree.right:
-            self.post_prune(tree.right, vx, vy)
-        noraml_acc = self._eval(tree, vx, vy)
-        tree.value = tree.major
-        leaf_acc = self._eval(tree, vx, vy)
-        if noraml_acc <= leaf_acc:
+            return vy == tree.value
+        left = self._prune(tree.left, vx, vy)
+        right = self._prune(tree.right, vx, vy)
+        normal = np.where(vx[:, tree.feature] > tree.threshold, right, left)
+        leaf = vy == tree.major
+        if np.count_nonzero(normal) <= np.count_nonzero(leaf):
+            tree.value = tree.major
             tree.left = None
             tree.right = None
             tree.feature = None
             tree.threshold = None
+            return leaf
+        return normal
+
+    # 最小代价复杂度剪枝：R(t) 为 t 塌缩成叶子时的训练误分类率，R(T_t) 为子树 T_t 各叶子的误分类率之和，
+    # 有效 alpha g(t) = (R(t) - R(T_t)) / (|T_t| - 1)。每次剪掉 g 最小的节点（最弱连接），用堆维护，
+    # 剪掉后只更新其祖先的 g。节点被剪时的 alpha 记在 node.alpha 上，之后任意 alpha 的子树都能直接取出
+    def cost_complexity_path(self):
+        with self._span("ccp_path"):
+            return self._cost_complexity_path()
+
+    def _cost_complexity_path(self):
+        nodes = [self.root]
+        parent = [-1]
+        for i, node in enumerate(nodes):
+            if not node.is_leaf():
+                nodes += [node.left, node.right]
+                parent += [i, i]
+        size = len(nodes)
+        total = self.root.n_samples
+        left = np.full(size, -1, dtype=np.intp)
+        right = np.full(size, -1, dtype=np.intp)
+        # 误分类数保持为整数，g 只在最后做一次除法，数学上相等的 alpha 得到相同的浮点数
+        leaf_err = np.array([node.n_errors for node in nodes], dtype=np.int64)
+        sub_err = np.where([node.is_leaf() for node in nodes], leaf_err, 0)
+        sub_leaves = np.array([1 if node.is_leaf() else 0 for node in nodes], dtype=np.intp)
+        # BFS 序里子节点总在父节点之后，倒序累加即自底向上
+        for i in range(size - 1, 0, -1):
+            p = parent[i]
+            sub_err[p] += sub_err[i]
+            sub_leaves[p] += sub_leaves[i]
+            if right[p] < 0:
+                right[p] = i
+            else:
+                left[p] = i
+        for node in nodes:
+            node.alpha = np.inf
+
+        def g(i):
+            return (leaf_err[i] - sub_err[i]) / (total * (sub_leaves[i] - 1))
+
+        cur = np.full(size, np.inf)
+        heap = []
+        for i in range(size):
+            if sub_leaves[i] > 1:
+                cur[i] = g(i)
+                heap.append((cur[i], i))
+        heapq.heapify(heap)
+        pruned = np.zeros(size, dtype=bool)
+        alphas = [0.0]
+        impurities = [sub_err[0] / total]
+        n_leaves = [sub_leaves[0]]
+        while heap:
+            a, i = heapq.heappop(heap)
+            if pruned[i] or a != cur[i]:
+                continue
+            a = max(a, alphas[-1])
+            nodes[i].alpha = a
+            stack = [i]
+            while stack:
+                j = stack.pop()
+                if not pruned[j]:
+                    pruned[j] = True
+                    stack += [c for c in (left[j], right[j]) if c >= 0]
+            d_err = leaf_err[i] - sub_err[i]
+            d_leaves = sub_leaves[i] - 1
+            sub_err[i] = leaf_err[i]
+            sub_leaves[i] = 1
+            p = parent[i]
+            while p >= 0:
+                sub_err[p] += d_err
+                sub_leaves[p] -= d_leaves
+                cur[p] = g(p)
+                heapq.heappush(heap, (cur[p], p))
+                p = parent[p]
+            # 同一 alpha 下剪掉的多个节点合并为路径上的一步
+            if a > alphas[-1]:
+                alphas.append(a)
+                impurities.append(sub_err[0] / total)
+                n_leaves.append(sub_leaves[0])
+            else:
+                impurities[-1] = sub_err[0] / total
+                n_leaves[-1] = sub_leaves[0]
+        self.ccp_alphas = np.array(alphas)
+        self.ccp_impurities = np.array(impurities)
+        self.ccp_n_leaves = np.array(n_leaves)
+        return self.ccp_alphas, self.ccp_impurities
+
+    # 取出 alpha 对应的剪枝子树用于预测；可以反复调用，prune(None) 恢复完整的树
+    def prune(self, alpha):
+        self.alpha = alpha
+        self.flat = FlatTree(self.root, alpha)
+
+    # k 折交叉验证选 alpha：全量数据和每折各建一棵树，每折在自己的剪枝路径上评估所有候选 alpha，
+    # 候选取全量路径相邻 alpha 的几何平均；各折可以在进程池里并行，训练数据经共享内存传给 worker
+    def fit_cv(self, x, y, k=5, n_jobs=1, random_state=None):
+        x = np.array(x)
+        y = np.array(y)
+        self.fit(x, y)
+        alphas = self.ccp_alphas
+        candidates = np.append(np.sqrt(alphas[:-1] * alphas[1:]), alphas[-1])
+        folds = np.array_split(np.random.default_rng(random_state).permutation(len(y)), k)
+        tests = folds
+        trains = [np.concatenate(folds[:i] + folds[i + 1 :]) for i in range(k)]
+        params = dict(min_samples_split=self.min_samples_split, max_depth=self.max_depth, max_bins=self.max_bins)
+        args = (repeat(params), trains, tests, repeat(candidates))
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        if n_jobs <= 1:
+            _cv_init(x, y)
+            try:
+                errors = sum(map(_cv_fold, *args))
+            finally:
+                _cv_init(None, None)
         else:
-            tree.value = None
+            with share(x, y) as specs:
+                with ProcessPoolExecutor(min(n_jobs, k), initializer=_cv_attach, initargs=tuple(specs)) as pool:
+                    errors = sum(pool.map(_cv_fold, *args))
+        self.cv_errors = errors / len(y)
+        # 误差相同时取更大的 alpha，即更小的树
+        best = len(errors) - 1 - np.argmin(errors[::-1])
+        self.prune(alphas[best])
+        return alphas[best]
+
+    def _gini(self, cnt, tot):
+        return 1 - np.sum((cnt / tot[..., None]) ** 2, axis=1)
 
-    def _gini(self, y):
-        cnt = Counter(y)
-        tot = len(y)
-        return 1 - sum((count / tot) ** 2 for count in cnt.values())
+    # 返回 (最小加权 gini, 阈值, 候选阈值数)；候选数交给调用方记录，worker 线程里没有当前节点
+    def _scan_feature(self, col, one_hot, total):
+        m = len(col)
+        order = np.argsort(col, kind="stable")
+        col = col[order]
+        # 候选阈值为相邻不同取值中的较小者，左子树为 col <= col[pos]
+        pos = np.flatnonzero(col[:-1] != col[1:])
+        if len(pos) == 0:
+            return float("inf"), None, 0
+        left_cnt = np.cumsum(one_hot[order], axis=0)[pos]
+        right_cnt = total - left_cnt
+        left_num = pos + 1
+        right_num = m - left_num
+        w_gini = (left_num * self._gini(left_cnt, left_num) + right_num * self._gini(right_cnt, right_num)) / m
+        best = np.argmin(w_gini)
+        return w_gini[best], col[pos[best]], len(pos)
 
-    def _find_threshold(self, x, y):
+    # 节点内标签的 one-hot 矩阵和类别计数，列按节点内出现的标签排序
+    def _one_hot(self, labels):
+        _, y_code = np.unique(labels, return_inverse=True)
+        one_hot = np.zeros((len(labels), y_code.max() + 1), dtype=np.int64)
+        one_hot[np.arange(len(labels)), y_code] = 1
+        return one_hot, one_hot.sum(axis=0)
+
+    # 进程后端的一个任务：在 worker 里由共享的 x 和标签编码取出本节点的列，依次扫描 feats
+    def _scan_features(self, x, y_code, rows, feats):
+        one_hot, total = self._one_hot(y_code[rows])
+        return [self._scan_feature(x[rows, each_feature], one_hot, total) for each_feature in feats]
+
+    def _find_threshold(self, x, y, rows, pool=None):
         gini = float("inf")
         feature = None
         threshold = None
-        m, n = x.shape
-        for each_feature in range(n):
-            thresholds = np.unique(x[:, each_feature])
-            for each_threshold in thresholds:
-                left_mask = x[:, each_feature] <= each_threshold
-                right_mask = ~left_mask
-                if np.sum(left_mask) == 0 or np.sum(right_mask) == 0:
-                    continue
-                gini_left = self._gini(y[left_mask])
-                gini_right = self._gini(y[right_mask])
-                w_gini = (np.sum(left_mask) * gini_left + np.sum(right_mask) * gini_right) / m
-                if w_gini < gini:
-                    gini = w_gini
-                    feature = each_feature
-                    threshold = each_threshold
+        m, n = len(rows), x.shape[1]
+        one_hot, total = self._one_hot(y[rows])
+        # 小节点的扫描比一次进程间往返还便宜，留在主进程里做
+        if pool is None or (self.backend == "process" and m < PROCESS_MIN_ROWS):
+            cols = (x[rows, each_feature] for each_feature in range(n))
+            results = map(self._scan_feature, cols, repeat(one_hot), repeat(total))
+        elif self.backend == "process":
+            # 特征分成 n_jobs 块，每块一个任务，行下标每块只传一次
+            chunks = [chunk for chunk in np.array_split(np.arange(n), self.n_jobs) if len(chunk)]
+            results = chain.from_iterable(pool.map(_worker_call, repeat("_scan_features"), repeat(rows), chunks))
+        else:
+            cols = (x[rows, each_feature] for each_feature in range(n))
+            results = pool.map(self._scan_feature, cols, repeat(one_hot), repeat(total))
+        # 结果按特征顺序归并，严格小于才更新，与 worker 数无关
+        candidates = 0
+        for each_feature, (w_gini, each_threshold, n_candidates) in enumerate(results):
+            candidates += n_candidates
+            if w_gini < gini:
+                gini = w_gini
+                feature = each_feature
+                threshold = each_threshold
+        if self.profiler is not None:
+            self.profiler.add("candidates", candidates)
+            self.profiler.add("bytes_copied", m * n * x.itemsize + one_hot.nbytes)
+            if feature is not None:
+                self.profiler.set(gain=float(self._gini(total[None], np.array([m]))[0] - gini))
         return feature, threshold
 
-    def _create(self, x, y, depth):
-        data_num = x.shape[0]
-        class_num = len(np.unique(y))
-        res = Counter(y).most_common(1)[0][0]
+    def _span(self, name):
+        return nullcontext() if self.profiler is None else self.profiler.span(name)
+
+    # arrays 为进程后端要放进共享内存的训练数据；池先于共享内存关闭
+    @contextmanager
+    def _pool(self, *arrays):
+        if self.n_jobs <= 1:
+            yield None
+        elif self.backend == "process":
+            with share(*arrays) as specs:
+                with ProcessPoolExecutor(self.n_jobs, initializer=_worker_init, initargs=(self._worker_model(), *specs)) as pool:
+                    yield pool
+        else:
+            with ThreadPoolExecutor(self.n_jobs) as pool:
+                yield pool
+
+    # 发给 worker 进程的模型副本：不带上一次的训练结果和 profiler，在 worker 里串行建树
+    def _worker_model(self):
+        model = copy.copy(self)
+        model.root = model.flat = model.profiler = None
+        model.n_jobs = 1
+        return model
+
+    # 把交给 worker 的子树（Future）替换为建好的节点
+    def _resolve(self, node):
+        if isinstance(node, Future):
+            return node.result()
+        if not node.is_leaf():
+            node.left = self._resolve(node.left)
+            node.right = self._resolve(node.right)
+        return node
+
+    # 按 mask 把 idx[start:end] 稳定地划分为左右两段，返回分界位置；稳定划分保证样本相对次序与拷贝子数组时一致
+    def _partition(self, idx, start, end, mask):
+        rows = idx[start:end]
+        left, right = rows[mask], rows[~mask]
+        if self.profiler is not None:
+            self.profiler.add("masks", 2)
+            self.profiler.add("bytes_copied", 2 * mask.nbytes + rows.nbytes)
+        mid = start + len(left)
+        idx[start:mid] = left
+        idx[mid:end] = right
+        return mid
+
+    def _create(self, x, y, idx, start, end, depth, pool=None):
+        if self.profiler is None:
+            return self._create_node(x, y, idx, start, end, depth, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_node(x, y, idx, start, end, depth, pool)
+        self.profiler.end(node)
+        return node
+
+    def _create_node(self, x, y, idx, start, end, depth, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_subtree", rows, depth)
+            return pool.submit(self._create, x, y, idx, start, end, depth)
+        class_num = len(np.unique(y[rows]))
+        res = Counter(y[rows]).most_common(1)[0][0]
+        errors = data_num - np.count_nonzero(y[rows] == res)
         if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
-            return Node(value=res, major=res)
-        feature, threshold = self._find_threshold(x, y)
+            return Node(value=res, major=res, n_samples=data_num, n_errors=errors)
+        feature, threshold = self._find_threshold(x, y, rows, pool)
         if feature is None:
-            return Node(value=res, major=res)
-        left_mask = x[:, feature] <= threshold
-        right_mask = ~left_mask
-        left = self._create(x[left_mask], y[left_mask], depth + 1)
-        right = self._create(x[right_mask], y[right_mask], depth + 1)
-        return Node(feature=feature, threshold=threshold, left=left, right=right, major=res)
+            return Node(value=res, major=res, n_samples=data_num, n_errors=errors)
+        mid = self._partition(idx, start, end, x[rows, feature] <= threshold)
+        left = self._create(x, y, idx, start, mid, depth + 1, pool)
+        right = self._create(x, y, idx, mid, end, depth + 1, pool)
+        return Node(feature=feature, threshold=threshold, left=left, right=right, major=res, n_samples=data_num, n_errors=errors)
+
+    # 在 worker 进程里建 rows 对应的子树，x 和 y_code 为共享内存里的完整数据
+    def _create_subtree(self, x, y_code, rows, depth):
+        idx = np.arange(len(rows))
+        return self._create(x[rows], self.classes[y_code[rows]], idx, 0, len(idx), depth)
+
+    def _find_threshold_hist(self, hist, m):
+        left_cnt = np.cumsum(hist, axis=1)
+        right_cnt = left_cnt[:, -1:] - left_cnt
+        left_num = left_cnt.sum(axis=2)
+        right_num = m - left_num
+        valid = (left_num > 0) & (right_num > 0)
+        if not valid.any():
+            return None, None
+        w_gini = np.full(left_num.shape, np.inf)
+        w_gini[valid] = (
+            left_num[valid] * self._gini(left_cnt[valid], left_num[valid])
+            + right_num[valid] * self._gini(right_cnt[valid], right_num[valid])
+        ) / m
+        # 与 _find_threshold 相同的平局规则：先特征序，再阈值序
+        feature, b = np.unravel_index(np.argmin(w_gini), w_gini.shape)
+        if self.profiler is not None:
+            self.profiler.add("candidates", np.count_nonzero(valid))
+            total = left_cnt[0, -1]
+            self.profiler.set(gain=float(self._gini(total[None], np.array([m]))[0] - w_gini[feature, b]))
+        return int(feature), int(b)
+
+    def _create_hist(self, codes, y_code, hist, idx, start, end, depth, pool=None):
+        if self.profiler is None:
+            return self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pool)
+        self.profiler.begin(depth, end - start)
+        node = self._create_hist_node(codes, y_code, hist, idx, start, end, depth, pool)
+        self.profiler.end(node)
+        return node
+
+    def _create_hist_node(self, codes, y_code, hist, idx, start, end, depth, pool=None):
+        rows = idx[start:end]
+        data_num = end - start
+        if pool is not None and data_num <= self.subtree_cutoff:
+            if self.backend == "process":
+                return pool.submit(_worker_call, "_create_hist_subtree", rows, hist, depth)
+            return pool.submit(self._create_hist, codes, y_code, hist, idx, start, end, depth)
+        class_num = np.count_nonzero(hist[0].sum(axis=0))
+        code = Counter(y_code[rows]).most_common(1)[0][0]
+        res = self.classes[code]
+        errors = data_num - np.count_nonzero(y_code[rows] == code)
+        if data_num < self.min_samples_split or depth >= self.max_depth or class_num == 1:
+            return Node(value=res, major=res, n_samples=data_num, n_errors=errors)
+        feature, b = self._find_threshold_hist(hist, data_num)
+        if feature is None:
+            return Node(value=res, major=res, n_samples=data_num, n_errors=errors)
+        mid = self._partition(idx, start, end, codes[rows, feature] <= b)
+        left_rows, right_rows = idx[start:mid], idx[mid:end]
+        if (mid - start) * 2 <= data_num:
+            left_hist = self._histogram(codes, y_code, left_rows)
+            right_hist = hist - left_hist
+        else:
+            right_hist = self._histogram(codes, y_code, right_rows)
+            left_hist = hist - right_hist
+        if self.profiler is not None:
+            self.profiler.add("bytes_copied", min(mid - start, end - mid) * codes.shape[1] * codes.itemsize + 2 * hist.nbytes)
+        left = self._create_hist(codes, y_code, left_hist, idx, start, mid, depth + 1, pool)
+        right = self._create_hist(codes, y_code, right_hist, idx, mid, end, depth + 1, pool)
+        return Node(
+            feature=feature,
+            threshold=self.bin_edges[feature][b],
+            left=left,
+            right=right,
+            major=res,
+            n_samples=data_num,
+            n_errors=errors,
+        )
+
+    # 在 worker 进程里建 rows 对应的子树，codes 和 y_code 为共享内存里的完整数据，直接按下标划分
+    def _create_hist_subtree(self, codes, y_code, rows, hist, depth):
+        idx = rows.copy()
+        return self._create_hist(codes, y_code, hist, idx, 0, len(idx), depth)
 
     def predict(self, x):
-        return [self._search(each, self.root) for each in x]
+        if self.profiler is None:
+            return self.flat.predict(np.asarray(x))
+        with self.profiler.span("predict"):
+            lengths = np.zeros(len(x), dtype=np.intp)
+            res = self.flat.predict(np.asarray(x), lengths)
+        self.profiler.paths(lengths)
+        return res
 
     def _search(self, x, tree: Node):
         if tree.is_leaf():
@@ -102,26 +570,13 @@ class DecisionTree:
             return self._search(x, tree.left)
 
 
-df = pd.read_csv("heartdisease.csv")
-data = df.to_numpy()
-tot = data.shape[0]
-for EPOCH in range(20):
-    indices = np.random.permutation(tot)
-    r = [0.2, 0.1]
-
-    test_len = int(r[0] * tot)
-    eval_len = int(r[1] * tot)
-
-    test_x = data[indices[:test_len], :-1]
-    eval_x = data[indices[test_len : test_len + eval_len], :-1]
-    train_x = data[indices[test_len + eval_len :], :-1]
-    test_y = data[indices[:test_len], -1]
-    eval_y = data[indices[test_len : test_len + eval_len], -1]
-    train_y = data[indices[test_len + eval_len :], -1]
-
-    tree = DecisionTree(min_samples_split=2, max_depth=10)
-    tree.fit(train_x, train_y)
-    tree.post_prune(tree.root, eval_x, eval_y)
-    predictions = tree.predict(test_x)
-    res = sum([1 if predictions[i] == test_y[i] else 0 for i in range(test_len)]) / test_len * 100
-    print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
+if __name__ == "__main__":
+    from functools import partial
+    from experiment import run
+
+    df = pd.read_csv("heartdisease.csv")
+    data = df.to_numpy()
+    # fit 时传入验证集即做后剪枝
+    result = run(partial(DecisionTree, min_samples_split=2, max_depth=10), data, test_ratio=0.2, eval_ratio=0.1, epochs=20)
+    for EPOCH, res in enumerate(result["acc"]):
+        print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
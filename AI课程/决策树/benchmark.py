@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import CART_1
+import CART_2
+import CART_3
+from C45 import C45
+
+# 可复现的训练 / 预测 / 剪枝基准，结果写成 JSON，便于对比不同提交的性能
+# 数据集只由 (种类, 行数, 特征数, 离散取值数, 类别数, seed) 生成，不读文件：
+#   circle：points.py 圆形数据的放大版，半径 20 的圆内均匀取点，半径 12 以内为 1 类；类别数 > 2 时按半径等分成环
+#   tabular：heartdisease.csv 形状的表格，约 60% 为离散列（取值 0..cardinality-1），其余为一位小数的连续列，
+#            标签由各列的隐含效应加噪声后按分位数切成 classes 类
+# 划分与 experiment.py 相同：20% 测试、10% 验证（CART_3 建树和 CART_2 剪枝用），其余训练
+# 每项计时跑 repeat 次取最小值；峰值内存另跑一次在 tracemalloc 下测，tracemalloc 会拖慢纯 Python 部分，不与计时混用
+
+MODELS = ["CART_1", "CART_2", "CART_3", "C45"]
+DEFAULT_ROWS = [1000, 10000, 100000]
+
+
+def circle(rows, classes=2, seed=0):
+    rng = np.random.default_rng(seed)
+    r = 20 * np.sqrt(rng.random(rows))
+    theta = 2 * np.pi * rng.random(rows)
+    x = np.column_stack((r * np.cos(theta), r * np.sin(theta))).round(2)
+    if classes == 2:
+        y = (np.hypot(x[:, 0], x[:, 1]) < 12).astype(np.int64)
+    else:
+        y = np.minimum((np.hypot(x[:, 0], x[:, 1]) / 20 * classes).astype(np.int64), classes - 1)
+    return x, y, ["continuous"] * 2
+
+
+def tabular(rows, features=13, cardinality=4, classes=2, seed=0):
+    rng = np.random.default_rng(seed)
+    n_discrete = int(round(features * 0.6))
+    x = np.empty((rows, features))
+    score = rng.normal(0, 1, rows)
+    for f in range(features):
+        if f < n_discrete:
+            col = rng.integers(0, cardinality, rows)
+            score += rng.normal(0, 1, cardinality)[col]
+        else:
+            col = rng.normal(0, 1, rows)
+            score += rng.normal(0, 1) * col
+            col = (col * 10 + 50).round(1)
+        x[:, f] = col
+    y = np.searchsorted(np.quantile(score, np.linspace(0, 1, classes + 1)[1:-1]), score)
+    feature_types = ["discrete" if f < n_discrete else "continuous" for f in range(features)]
+    return x, y, feature_types
+
+
+def make_dataset(spec):
+    if spec["kind"] == "circle":
+        return circle(spec["rows"], spec["classes"], spec["seed"])
+    return tabular(spec["rows"], spec["features"], spec["cardinality"], spec["classes"], spec["seed"])
+
+
+def _split(m, seed):
+    indices = np.random.default_rng(seed).permutation(m)
+    test_len = int(0.2 * m)
+    eval_len = int(0.1 * m)
+    return indices[:test_len], indices[test_len : test_len + eval_len], indices[test_len + eval_len :]
+
+
+def _fit(name, params, feature_types, x, y, vx, vy):
+    if name == "C45":
+        model = C45(feature_types=feature_types, **params)
+        model.fit(x, y)
+    elif name == "CART_3":
+        model = CART_3.DecisionTree(**params)
+        model.fit(x, y, vx, vy)
+    else:
+        model = {"CART_1": CART_1, "CART_2": CART_2}[name].DecisionTree(**params)
+        model.fit(x, y)
+    return model
+
+
+# CART_2 的两种剪枝：代价复杂度剪枝路径，和用验证集的错误率降低剪枝；CART_3 的剪枝在建树时完成，计在 fit 里
+def _prune_steps(name, vx, vy):
+    if name != "CART_2":
+        return {}
+    return {
+        "ccp_path": lambda model: model.cost_complexity_path(),
+        "reduced_error": lambda model: model.post_prune(model.root, vx, vy),
+    }
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - start
+
+
+def _peak(func, *args):
+    tracemalloc.start()
+    try:
+        res = func(*args)
+        return res, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name, spec, params, repeat=3):
+    x, y, feature_types = make_dataset(spec)
+    test_idx, eval_idx, train_idx = _split(len(y), spec["seed"])
+    tx, ty = x[test_idx], y[test_idx]
+    vx, vy = x[eval_idx], y[eval_idx]
+    args = (name, params, feature_types, x[train_idx], y[train_idx], vx, vy)
+    steps = _prune_steps(name, vx, vy)
+
+    fit_times, predict_times = [], []
+    prune_times = {step: [] for step in steps}
+    for _ in range(repeat):
+        model, t = _timed(_fit, *args)
+        fit_times.append(t)
+        pred, t = _timed(model.predict, tx)
+        predict_times.append(t)
+        # 剪枝会改动模型，按顺序在刚训练好的模型上做
+        for step, func in steps.items():
+            prune_times[step].append(_timed(func, model)[1])
+
+    model, fit_peak = _peak(_fit, *args)
+    nodes = len(model.flat.feature)
+    _, predict_peak = _peak(model.predict, tx)
+    prune_peak = {}
+    for step, func in steps.items():
+        prune_peak[step] = _peak(func, model)[1]
+
+    return {
+        "model": name,
+        "dataset": spec,
+        "params": params,
+        "train_rows": len(train_idx),
+        "test_rows": len(test_idx),
+        "nodes": nodes,
+        "acc": float(np.count_nonzero(np.asarray(pred) == ty) / len(ty) * 100),
+        "fit_seconds": min(fit_times),
+        "predict_seconds": min(predict_times),
+        "prune_seconds": {step: min(times) for step, times in prune_times.items()},
+        "fit_seconds_all": fit_times,
+        "predict_seconds_all": predict_times,
+        "fit_peak_bytes": fit_peak,
+        "predict_peak_bytes": predict_peak,
+        "prune_peak_bytes": prune_peak,
+    }
+
+
+def _git(*args):
+    try:
+        res = subprocess.run(["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def environment():
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        # 工作区相对该提交有改动时为 True，此时 commit 不能完全代表被测代码
+        "dirty": bool(_git("status", "--porcelain", "--", ".")),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def suite(kinds=("circle", "tabular"), rows=DEFAULT_ROWS, models=MODELS, features=13, cardinality=4, classes=2, seed=0, repeat=3, **params):
+    results = []
+    for kind in kinds:
+        for m in rows:
+            if kind == "circle":
+                spec = {"kind": kind, "rows": m, "features": 2, "cardinality": 0, "classes": classes, "seed": seed}
+            else:
+                spec = {"kind": kind, "rows": m, "features": features, "cardinality": cardinality, "classes": classes, "seed": seed}
+            for name in models:
+                res = bench(name, spec, params, repeat)
+                print(
+                    "%-8s %-8s %7d rows  fit %8.3fs  predict %8.4fs  peak %7.1f MB  acc %6.2f%%"
+                    % (kind, name, m, res["fit_seconds"], res["predict_seconds"], res["fit_peak_bytes"] / 2**20, res["acc"])
+                )
+                results.append(res)
+    return {"environment": environment(), "results": results}
+
+
+def _key(res):
+    return (res["model"], json.dumps(res["dataset"], sort_keys=True), json.dumps(res["params"], sort_keys=True))
+
+
+# 按 (模型, 数据集, 参数) 对齐两次运行，打印 new / old 的时间和内存比值
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {_key(res): res for res in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print("%-8s %-8s %7s %8s %8s %8s" % ("data", "model", "rows", "fit", "predict", "peak"))
+    for res in new:
+        base = old.get(_key(res))
+        if base is None:
+            continue
+        print(
+            "%-8s %-8s %7d %7.2fx %7.2fx %7.2fx"
+            % (
+                res["dataset"]["kind"],
+                res["model"],
+                res["dataset"]["rows"],
+                res["fit_seconds"] / base["fit_seconds"],
+                res["predict_seconds"] / base["predict_seconds"],
+                res["fit_peak_bytes"] / max(base["fit_peak_bytes"], 1),
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", nargs="+", default=["circle", "tabular"], choices=["circle", "tabular"])
+    parser.add_argument("--rows", nargs="+", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--models", nargs="+", default=MODELS, choices=MODELS)
+    parser.add_argument("--features", type=int, default=13)
+    parser.add_argument("--cardinality", type=int, default=4)
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--max-bins", type=int, default=None)
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = suite(
+            args.datasets,
+            args.rows,
+            args.models,
+            args.features,
+            args.cardinality,
+            args.classes,
+            args.seed,
+            args.repeat,
+            max_depth=args.max_depth,
+            max_bins=args.max_bins,
+        )
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+        print("results written to %s" % args.out)
@@ -0,0 +1,305 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import CART_1
+import CART_2
+import CART_3
+import model_io
+from C45 import C45
+from benchmark import tabular
+from codegen import MAX_NEST, compile_tree, model_hash, source
+from forest import RandomForest
+from sweep import sweep, truncate
+
+# 回归检查：python checks.py [检查名 ...]，全部通过时每项打印一行 ok，任何一项不符直接 AssertionError
+#   ccp：CART_2 的剪枝路径与逐步重算所有节点 g(t) 的最弱连接剪枝一致，prune(alpha) 的叶子数与路径一致，
+#        fit_cv 选出的 alpha 与 n_jobs 无关
+#   parallel：各模型 n_jobs > 1（线程 / 进程、子树分发、直方图）建出的树与 n_jobs=1 完全相同
+#   forest：max_features 随机抽特征时，树与 n_jobs、后端无关，同一 random_state 重复 fit 结果相同；随机森林与 n_jobs 无关
+#   sweep：网格里每组参数的验证准确率、截断出的树都与用这组参数重新训练的结果相同
+#   codegen：生成的函数逐行与 predict 相同，覆盖 CART、剪枝后的 CART_2、带没见过的离散取值的 C4.5、
+#            model_io.load 得到的模型、超过 MAX_NEST 层需要拆函数的深树
+#   model_io：CART / C4.5、精确 / 直方图、字符串标签的模型存盘后 load 回来，数组是 memmap、预测与原模型相同；
+#             版本 1 的 C4.5 文件、更新版本的文件和非模型文件被拒绝
+#   fallback：C4.5 的 predict（FlatTree.route）与逐行递归的 _search 相同，包括在某个离散节点上没见过的取值
+# 两棵树相同指 model_hash 相同，即 FlatTree 的所有数组逐元素相等
+
+# 行数超过 PROCESS_MIN_ROWS，进程后端的特征扫描也会分发出去
+ROWS = 4000
+# heartdisease.csv 各列的类型，同 C45.py 的 __main__
+HEART_TYPES = ["continuous", "discrete", "discrete", "continuous", "continuous", "discrete", "discrete"]
+HEART_TYPES += ["continuous", "discrete", "continuous", "discrete", "discrete", "discrete"]
+
+
+def _data(rows=ROWS, seed=0):
+    x, y, feature_types = tabular(rows, seed=seed)
+    split = int(0.8 * rows)
+    return x[:split], y[:split], x[split:], y[split:], feature_types
+
+
+# 每个离散列约两成的行换成 -1、4、7，tabular 的离散取值为 0..3，这些取值训练时没出现过
+def _unseen(x, feature_types, seed=0):
+    rng = np.random.default_rng(seed)
+    x = x.copy()
+    for f, kind in enumerate(feature_types):
+        if kind == "discrete":
+            rows = rng.random(len(x)) < 0.2
+            x[rows, f] = rng.choice([-1, 4, 7], np.count_nonzero(rows))
+    return x
+
+
+# 不用堆、不做增量更新：每一步对当前树的每个内部节点从叶子重新求 g(t)，同时剪掉所有 g 最小的节点
+def _brute_alphas(root):
+    total = root.n_samples
+    cut = set()
+
+    def leaves(node):
+        if node.is_leaf() or id(node) in cut:
+            return [node]
+        return leaves(node.left) + leaves(node.right)
+
+    def internal(node):
+        if node.is_leaf() or id(node) in cut:
+            return []
+        return [node] + internal(node.left) + internal(node.right)
+
+    alphas = [0.0]
+    n_leaves = [len(leaves(root))]
+    while internal(root):
+        g = {}
+        for node in internal(root):
+            sub = leaves(node)
+            g[id(node)] = (node.n_errors - sum(leaf.n_errors for leaf in sub)) / (total * (len(sub) - 1))
+        a = min(g.values())
+        cut.update(key for key, value in g.items() if value == a)
+        if a > alphas[-1]:
+            alphas.append(a)
+            n_leaves.append(len(leaves(root)))
+        else:
+            n_leaves[-1] = len(leaves(root))
+    return np.array(alphas), np.array(n_leaves)
+
+
+def check_ccp():
+    x, y, vx, vy, _ = _data(1500)
+    for params in [dict(max_depth=8), dict(max_depth=6, min_samples_split=20), dict(max_depth=8, max_bins=16)]:
+        tree = CART_2.DecisionTree(**params)
+        tree.fit(x, y)
+        alphas, n_leaves = _brute_alphas(tree.root)
+        assert np.allclose(tree.ccp_alphas, alphas, rtol=1e-12, atol=0), params
+        assert np.array_equal(tree.ccp_n_leaves, n_leaves), params
+        for a, leaves in zip(tree.ccp_alphas, tree.ccp_n_leaves):
+            tree.prune(a)
+            assert np.count_nonzero(tree.flat.feature < 0) == leaves, (params, a)
+        tree.prune(None)
+    tree = CART_2.DecisionTree(max_depth=6)
+    alpha = tree.fit_cv(x, y, k=4, random_state=0)
+    assert tree.fit_cv(x, y, k=4, n_jobs=2, random_state=0) == alpha
+    print("ccp ok")
+
+
+# 依次用 variants 里的并行设置建树，与 n_jobs=1 的 ref 比较
+def _same_as_serial(name, cls, params, args, variants):
+    for max_bins in [None, 32]:
+        ref = cls(max_bins=max_bins, **params)
+        ref.fit(*args)
+        for extra in variants:
+            tree = cls(max_bins=max_bins, **params, **extra)
+            tree.fit(*args)
+            assert model_hash(tree) == model_hash(ref), (name, max_bins, extra)
+
+
+PARALLEL = [
+    dict(n_jobs=3),
+    dict(n_jobs=3, subtree_cutoff=200),
+    dict(n_jobs=2, backend="process"),
+    dict(n_jobs=2, backend="process", subtree_cutoff=200),
+]
+
+
+def check_parallel():
+    x, y, vx, vy, feature_types = _data()
+    models = [
+        ("CART_1", CART_1.DecisionTree, {}, (x, y)),
+        ("CART_2", CART_2.DecisionTree, {}, (x, y, vx, vy)),
+        ("CART_3", CART_3.DecisionTree, {}, (x, y, vx, vy)),
+        ("C45", C45, dict(feature_types=feature_types), (x, y)),
+    ]
+    for name, cls, params, args in models:
+        _same_as_serial(name, cls, params, args, PARALLEL)
+        print("parallel %s ok" % name)
+
+
+def check_forest():
+    x, y, vx, vy, _ = _data()
+    params = dict(max_features="sqrt", random_state=0)
+    _same_as_serial("CART_1 max_features", CART_1.DecisionTree, params, (x, y), PARALLEL)
+    for max_bins in [None, 32]:
+        tree = CART_1.DecisionTree(max_bins=max_bins, **params)
+        tree.fit(x, y)
+        first = model_hash(tree)
+        tree.fit(x, y)
+        assert model_hash(tree) == first, max_bins
+    a = RandomForest(n_estimators=6, max_depth=6, random_state=0)
+    a.fit(x, y)
+    b = RandomForest(n_estimators=6, max_depth=6, random_state=0, n_jobs=2)
+    b.fit(x, y)
+    assert np.array_equal(a.predict(vx), b.predict(vx))
+    print("forest ok")
+
+
+def check_sweep():
+    x, y, vx, vy, _ = _data(2000)
+    max_depths, min_samples_splits = [1, 3, 5, 8], [2, 10, 40]
+    result = sweep(x, y, vx, vy, max_depths, min_samples_splits)
+    for i, d in enumerate(max_depths):
+        for j, s in enumerate(min_samples_splits):
+            fresh = CART_1.DecisionTree(max_depth=d, min_samples_split=s)
+            fresh.fit(x, y)
+            acc = np.count_nonzero(fresh.predict(vx) == vy) / len(vy) * 100
+            assert result["acc"][i, j] == acc, (d, s)
+            assert model_hash(truncate(result["tree"], d, s)) == model_hash(fresh), (d, s)
+    print("sweep ok")
+
+
+# 第 d 层的内部节点按 x[d % 3] > d 走右子树继续往下，左子树为叶子，共 depth 层
+def _chain(depth):
+    node = CART_1.Node(value=depth % 3)
+    for d in range(depth - 1, -1, -1):
+        node = CART_1.Node(feature=d % 3, threshold=float(d), left=CART_1.Node(value=d % 3), right=node)
+    model = CART_1.DecisionTree(max_depth=depth)
+    model.root = node
+    model.flat = CART_1.FlatTree(node)
+    return model
+
+
+def _same_as_compiled(model, x, cache_dir):
+    predict_one = compile_tree(model, cache_dir)
+    expected = model.predict(x)
+    assert all(predict_one(row) == p for row, p in zip(x, expected)), type(model).__name__
+
+
+# 编译 load 出来的模型（数组为 memmap），与原模型的 predict 比较；两者哈希相同，原模型之后编译会直接拿到同一个函数
+def _same_as_loaded(model, x, cache_dir):
+    path = os.path.join(cache_dir, "model.dtree")
+    model_io.save(model, path)
+    predict_one = compile_tree(model_io.load(path), cache_dir)
+    expected = model.predict(x)
+    assert all(predict_one(row) == p for row, p in zip(x, expected)), type(model).__name__
+
+
+def check_codegen():
+    x, y, vx, vy, feature_types = _data(2000)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for max_bins in [None, 32]:
+            tree = CART_1.DecisionTree(max_bins=max_bins)
+            tree.fit(x, y)
+            _same_as_loaded(tree, vx, cache_dir)
+
+            tree = CART_2.DecisionTree(max_bins=max_bins)
+            tree.fit(x, y)
+            for alpha in tree.ccp_alphas[:: max(len(tree.ccp_alphas) // 4, 1)]:
+                tree.prune(alpha)
+                _same_as_compiled(tree, vx, cache_dir)
+
+            tree = C45(max_bins=max_bins, feature_types=feature_types)
+            tree.fit(x, y)
+            _same_as_loaded(tree, _unseen(vx, feature_types), cache_dir)
+
+        model = _chain(3 * MAX_NEST)
+        assert source(model).count("def ") > 1
+        rows = np.random.default_rng(0).uniform(-1, 3 * MAX_NEST + 1, (500, 3))
+        rows[:100] = 3 * MAX_NEST + 1
+        _same_as_compiled(model, rows, cache_dir)
+    print("codegen ok")
+
+
+# 读文件时必须报 ValueError
+def _rejected(path):
+    try:
+        model_io.load(path)
+    except ValueError:
+        return True
+    return False
+
+
+def check_model_io():
+    x, y, vx, vy, feature_types = _data(2000)
+    labels = np.array(["no", "yes"])[y]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.dtree")
+        for make in [lambda **kw: CART_1.DecisionTree(**kw), lambda **kw: C45(feature_types=feature_types, **kw)]:
+            for max_bins in [None, 32]:
+                for target in [y, labels]:
+                    model = make(max_bins=max_bins)
+                    model.fit(x, target)
+                    # 每个模型一个文件，不覆盖仍被映射着的文件
+                    saved = os.path.join(tmp, "%s_%s_%s.dtree" % (type(model).__name__, max_bins, target.dtype.kind))
+                    model_io.save(model, saved)
+                    loaded = model_io.load(saved)
+                    assert type(loaded) is type(model)
+                    assert isinstance(loaded.flat.feature, np.memmap) and isinstance(loaded.flat.classes, np.memmap)
+                    rows = _unseen(vx, feature_types)
+                    assert np.array_equal(loaded.predict(rows), model.predict(rows)), (type(model).__name__, max_bins)
+                    assert model_io.read_meta(saved)["params"]["max_bins"] == max_bins
+
+        try:
+            model_io.save(CART_1.DecisionTree(), path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("saving an unfitted model should fail")
+
+        # 按版本 1 的写法（没有 fallback 数组）存一个 C4.5 文件
+        model = C45(feature_types=feature_types)
+        model.fit(x, y)
+        old = model_io.VERSION, model_io.C45_ARRAYS
+        model_io.VERSION, model_io.C45_ARRAYS = 1, tuple(name for name in model_io.C45_ARRAYS if name != "fallback")
+        try:
+            model_io.save(model, path)
+        finally:
+            model_io.VERSION, model_io.C45_ARRAYS = old
+        assert _rejected(path)
+
+        model_io.save(model, path)
+        with open(path, "r+b") as f:
+            f.seek(8)
+            f.write(np.array([model_io.VERSION + 1], dtype="<u4").tobytes())
+        assert _rejected(path)
+        with open(path, "wb") as f:
+            f.write(b"not a model file")
+        assert _rejected(path)
+    print("model_io ok")
+
+
+def check_fallback():
+    # heartdisease.csv 上的 C4.5 有多个离散节点，tabular 上连续特征占优，离散节点太少
+    data = pd.read_csv("heartdisease.csv").to_numpy()
+    x, y = data[:1000, :-1], data[:1000, -1]
+    vx = _unseen(data[1000:, :-1], HEART_TYPES)
+    for max_bins in [None, 32]:
+        model = C45(max_bins=max_bins, feature_types=HEART_TYPES)
+        model.fit(x, y)
+        expected = [model._search(row, model.root) for row in vx]
+        assert np.array_equal(model.predict(vx), expected), max_bins
+        # 确实有行停在 fallback 叶子上
+        leaves = model.flat.route(vx)
+        assert np.isin(leaves, model.flat.fallback[model.flat.fallback >= 0]).any(), max_bins
+    print("fallback ok")
+
+
+CHECKS = {
+    "ccp": check_ccp,
+    "parallel": check_parallel,
+    "forest": check_forest,
+    "sweep": check_sweep,
+    "codegen": check_codegen,
+    "model_io": check_model_io,
+    "fallback": check_fallback,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or CHECKS:
+        CHECKS[name]()
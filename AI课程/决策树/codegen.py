@@ -0,0 +1,139 @@
+import hashlib
+import os
+import tempfile
+import types
+import numpy as np
+
+# 把训练好的 CART / C4.5 树（model.flat）翻译成嵌套 if/else 的 Python 源码，单条样本预测就是一次普通函数调用
+# 连续节点：CART 为 x[f] > t 走右，C4.5 为 x[f] <= t 走左，与各自的 predict 一致
+# 离散节点：按取值查字典跳到子树函数，没见过的取值跳到该节点的 fallback 叶子，与 FlatTree.route 一致
+# 生成的模块按模型内容的哈希缓存在磁盘上，同一棵树只生成一次
+# 缓存文件会被当作代码执行：默认放在当前用户的缓存目录下，目录权限 0o700，且必须属于当前用户、其他人不可写；
+# 文件第一行记录其余内容的 sha256，校验通过后直接执行读到的内容，校验不过就重新生成
+
+CODEGEN_VERSION = 2
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "dtree_codegen")
+# 连续节点每嵌套这么多层就拆出一个新函数，避免超过解释器的缩进层数上限
+MAX_NEST = 40
+
+_loaded = {}
+
+
+def _arrays(flat):
+    names = ["feature", "threshold", "left", "right", "value", "classes"]
+    if hasattr(flat, "child"):
+        names += ["is_discrete", "child_offset", "child", "fallback"]
+    arrays = [(name, np.asarray(getattr(flat, name))) for name in names]
+    if hasattr(flat, "child"):
+        for f, cats in enumerate(flat.categories):
+            if cats is not None:
+                arrays.append(("categories%d" % f, np.asarray(cats)))
+    return arrays
+
+
+def model_hash(model):
+    h = hashlib.sha256(b"codegen %d" % CODEGEN_VERSION)
+    for name, arr in _arrays(model.flat):
+        arr = np.ascontiguousarray(arr)
+        h.update(("%s %s %s;" % (name, arr.dtype.str, arr.shape)).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def source(model):
+    flat = model.flat
+    is_c45 = hasattr(flat, "child")
+    classes = [c.item() for c in flat.classes]
+    funcs = []
+    tables = []
+    pending = [0]
+    named = {0}
+
+    def call(i):
+        if i not in named:
+            named.add(i)
+            pending.append(i)
+        return "_n%d(x)" % i
+
+    def emit(i, depth, out):
+        ind = "    " * depth
+        f = int(flat.feature[i])
+        if f < 0:
+            out.append("%sreturn %r" % (ind, classes[flat.value[i]]))
+        elif depth > MAX_NEST:
+            out.append("%sreturn %s" % (ind, call(i)))
+        elif is_c45 and flat.is_discrete[i]:
+            cats = flat.categories[f]
+            offset = flat.child_offset[i]
+            fallback = int(flat.fallback[i])
+            subs = [(cats[c].item(), int(flat.child[offset + c])) for c in range(len(cats)) if flat.child[offset + c] != fallback]
+            for _, sub in subs:
+                call(sub)
+            call(fallback)
+            tables.append("_d%d = {%s}" % (i, ", ".join("%r: _n%d" % (val, sub) for val, sub in subs)))
+            out.append("%sreturn _d%d.get(x[%d], _n%d)(x)" % (ind, i, f, fallback))
+        elif is_c45:
+            out.append("%sif x[%d] <= %r:" % (ind, f, float(flat.threshold[i])))
+            emit(int(flat.left[i]), depth + 1, out)
+            out.append("%selse:" % ind)
+            emit(int(flat.right[i]), depth + 1, out)
+        else:
+            out.append("%sif x[%d] > %r:" % (ind, f, float(flat.threshold[i])))
+            emit(int(flat.right[i]), depth + 1, out)
+            out.append("%selse:" % ind)
+            emit(int(flat.left[i]), depth + 1, out)
+
+    while pending:
+        i = pending.pop()
+        funcs.append("def _n%d(x):" % i)
+        emit(i, 1, funcs)
+        funcs.append("")
+        funcs.append("")
+
+    head = ["# generated by codegen.py, do not edit", "", ""]
+    return "\n".join(head + funcs + tables + ["", "predict_one = _n0", ""])
+
+
+def _private_dir(cache_dir):
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    st = os.stat(cache_dir)
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        raise PermissionError("codegen cache dir %s must be owned by the current user and not writable by others" % cache_dir)
+    return cache_dir
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# 读缓存文件，首行的哈希与内容不符（写了一半、被改过）或文件不存在时返回 None
+def _read_cached(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            head, _, text = f.read().partition("\n")
+    except FileNotFoundError:
+        return None
+    return text if head == "# sha256 " + _digest(text) else None
+
+
+def compile_tree(model, cache_dir=None):
+    key = model_hash(model)
+    if key in _loaded:
+        return _loaded[key]
+    cache_dir = _private_dir(cache_dir or CACHE_DIR)
+    name = "tree_%s" % key[:32]
+    path = os.path.join(cache_dir, name + ".py")
+    text = _read_cached(path)
+    if text is None:
+        text = source(model)
+        # 先写临时文件再改名，多个进程同时生成也不会读到半个文件
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("# sha256 %s\n%s" % (_digest(text), text))
+        os.replace(tmp, path)
+    # 执行校验过的内容而不是按路径重新导入，校验之后文件再被替换也不影响
+    module = types.ModuleType(name)
+    module.__file__ = path
+    exec(compile(text, path, "exec"), module.__dict__)
+    _loaded[key] = module.predict_one
+    return module.predict_one
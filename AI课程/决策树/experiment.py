@@ -0,0 +1,66 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from sharedmem import attach, share
+
+# 重复留出法实验：数据集只放一份在共享内存里，各 worker 进程按 epoch 自己切分、训练、测试
+# factory() 返回一个新模型；给出 eval_ratio 时以 fit(train_x, train_y, eval_x, eval_y) 训练
+# 第 epoch 轮的划分只由 (seed, epoch) 决定，与 worker 数量和调度顺序无关
+
+_data = None
+
+
+def _init(spec):
+    global _data
+    (_data,) = attach(spec)
+
+
+def _split(tot, test_ratio, eval_ratio, seed, epoch):
+    indices = np.random.default_rng([seed, epoch]).permutation(tot)
+    test_len = int(test_ratio * tot)
+    eval_len = 0 if eval_ratio is None else int(eval_ratio * tot)
+    return indices[:test_len], indices[test_len : test_len + eval_len], indices[test_len + eval_len :]
+
+
+def _epoch(factory, test_ratio, eval_ratio, seed, epoch):
+    test_idx, eval_idx, train_idx = _split(_data.shape[0], test_ratio, eval_ratio, seed, epoch)
+    test_x, test_y = _data[test_idx, :-1], _data[test_idx, -1]
+    train_x, train_y = _data[train_idx, :-1], _data[train_idx, -1]
+
+    model = factory()
+    start = time.perf_counter()
+    if eval_ratio is None:
+        model.fit(train_x, train_y)
+    else:
+        model.fit(train_x, train_y, _data[eval_idx, :-1], _data[eval_idx, -1])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = np.asarray(model.predict(test_x))
+    predict_time = time.perf_counter() - start
+
+    res = np.count_nonzero(predictions == test_y) / len(test_y) * 100
+    return res, fit_time, predict_time
+
+
+def run(factory, data, test_ratio=0.2, eval_ratio=None, epochs=20, seed=0, n_jobs=-1):
+    global _data
+    data = np.ascontiguousarray(data)
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    args = (repeat(factory), repeat(test_ratio), repeat(eval_ratio), repeat(seed), range(epochs))
+
+    if n_jobs <= 1:
+        _data = data
+        try:
+            results = list(map(_epoch, *args))
+        finally:
+            _data = None
+    else:
+        with share(data) as (spec,):
+            with ProcessPoolExecutor(max_workers=max(min(n_jobs, epochs), 1), initializer=_init, initargs=(spec,)) as pool:
+                results = list(pool.map(_epoch, *args))
+
+    results = np.array(results, dtype=float).reshape(-1, 3)
+    return {"acc": results[:, 0], "fit_time": results[:, 1], "predict_time": results[:, 2]}
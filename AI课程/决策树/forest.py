@@ -0,0 +1,118 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from CART_1 import DecisionTree
+from sharedmem import attach, share
+
+# 训练矩阵和标签编码放在共享内存里，worker 进程只收到每棵树的参数和随机种子
+_x = None
+_y = None
+
+
+def _init(x_spec, y_spec):
+    global _x, _y
+    _x, _y = attach(x_spec, y_spec)
+
+
+def _grow(params, bootstrap, seed):
+    rng = np.random.default_rng(seed)
+    m = len(_y)
+    rows = rng.integers(0, m, m) if bootstrap else np.arange(m)
+    tree = DecisionTree(**params, random_state=rng)
+    tree.fit(_x[rows], _y[rows])
+    return tree
+
+
+class RandomForest:
+    def __init__(
+        self,
+        n_estimators=100,
+        max_features="sqrt",
+        min_samples_split=2,
+        max_depth=10,
+        max_bins=None,
+        bootstrap=True,
+        n_jobs=1,
+        random_state=None,
+    ):
+        self.n_estimators = n_estimators
+        self.max_features = max_features
+        self.min_samples_split = min_samples_split
+        self.max_depth = max_depth
+        self.max_bins = max_bins
+        self.bootstrap = bootstrap
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.random_state = random_state
+        self.trees = []
+        self.classes = None
+
+    def fit(self, x, y):
+        global _x, _y
+        x = np.array(x, dtype=float)
+        # 树在类别编码上训练，叶子值即 classes 的下标
+        self.classes, y_code = np.unique(np.array(y), return_inverse=True)
+        params = dict(
+            min_samples_split=self.min_samples_split,
+            max_depth=self.max_depth,
+            max_bins=self.max_bins,
+            max_features=self.max_features,
+        )
+        # 每棵树一个独立的子种子，结果与 worker 数无关
+        seeds = np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
+        args = (repeat(params), repeat(self.bootstrap), seeds)
+        if self.n_jobs <= 1:
+            _x, _y = x, y_code
+            try:
+                self.trees = list(map(_grow, *args))
+            finally:
+                _x = _y = None
+        else:
+            workers = min(self.n_jobs, self.n_estimators)
+            with share(x, y_code) as (x_spec, y_spec):
+                with ProcessPoolExecutor(workers, initializer=_init, initargs=(x_spec, y_spec)) as pool:
+                    chunk = max(1, self.n_estimators // (workers * 4))
+                    self.trees = list(pool.map(_grow, *args, chunksize=chunk))
+        self._compile()
+
+    # 所有树的 FlatTree 首尾拼接成一组数组，root[t] 为第 t 棵树根节点的位置；leaf[i] 为叶子的类别编码，内部节点为 -1
+    def _compile(self):
+        flats = [tree.flat for tree in self.trees]
+        sizes = [len(flat.feature) for flat in flats]
+        self.root = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+        self.feature = np.concatenate([flat.feature for flat in flats])
+        self.threshold = np.concatenate([flat.threshold for flat in flats])
+        self.left = np.concatenate([np.where(flat.left >= 0, flat.left + off, -1) for flat, off in zip(flats, self.root)])
+        self.right = np.concatenate([np.where(flat.right >= 0, flat.right + off, -1) for flat, off in zip(flats, self.root)])
+        self.leaf = np.concatenate(
+            [np.where(flat.value >= 0, flat.classes[flat.value], -1).astype(np.intp) for flat in flats]
+        )
+
+    # (树, 样本) 对一起逐层下推，最后对每个样本的叶子类别计票；平票取编码较小的类别
+    def predict(self, x):
+        x = np.asarray(x, dtype=float)
+        n, k = len(x), len(self.classes)
+        node = np.repeat(self.root, n)
+        row = np.tile(np.arange(n), len(self.root))
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while len(active):
+            cur = node[active]
+            go_right = x[row[active], self.feature[cur]] > self.threshold[cur]
+            nxt = np.where(go_right, self.right[cur], self.left[cur])
+            node[active] = nxt
+            active = active[self.feature[nxt] >= 0]
+        votes = np.bincount(row * k + self.leaf[node], minlength=n * k).reshape(n, k)
+        return self.classes[np.argmax(votes, axis=1)]
+
+
+if __name__ == "__main__":
+    from functools import partial
+    from experiment import run
+
+    df = pd.read_csv("heartdisease.csv")
+    data = df.to_numpy()
+    # 各 epoch 已经并行，森林内部单进程
+    result = run(partial(RandomForest, n_estimators=100, max_depth=10, n_jobs=1), data, test_ratio=0.2, epochs=20)
+    for EPOCH, res in enumerate(result["acc"]):
+        print("EPOCH %d: %.2f%%" % (EPOCH + 1, res))
@@ -0,0 +1,127 @@
+import json
+import numpy as np
+
+# 模型文件格式（小端）：
+#   0   8 字节魔数 b"DTREE\0\0\0"
+#   8   uint32 格式版本
+#   12  uint32 元数据长度 L
+#   16  L 字节 UTF-8 JSON 元数据：模型种类、构造参数、各数组的 dtype/shape/offset
+#   之后是各数组的原始字节，每个数组的起始位置按 64 字节对齐
+# load 用 np.memmap 只读映射各数组，多个进程加载同一文件时共用页缓存，无需解析
+
+MAGIC = b"DTREE\0\0\0"
+VERSION = 2
+ALIGN = 64
+
+CART_ARRAYS = ("feature", "threshold", "left", "right", "value", "classes")
+C45_ARRAYS = CART_ARRAYS + ("is_discrete", "child_offset", "child", "fallback")
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _to_disk(arr):
+    arr = np.asarray(arr)
+    if arr.dtype == object:
+        raise TypeError("cannot save object arrays, convert labels to numbers or strings first")
+    # 统一存为小端
+    return np.ascontiguousarray(arr.astype(arr.dtype.newbyteorder("<")))
+
+
+def save(model, path):
+    flat = model.flat
+    if flat is None:
+        raise ValueError("model is not fitted")
+    arrays = {}
+    meta = {
+        "class": type(model).__name__,
+        "params": {
+            "min_samples_split": model.min_samples_split,
+            "max_depth": model.max_depth,
+            "max_bins": model.max_bins,
+        },
+    }
+    if hasattr(flat, "child"):
+        meta["kind"] = "c45"
+        meta["params"]["feature_types"] = list(model.feature_types)
+        names = C45_ARRAYS
+        # 各离散特征的取值表首尾拼接，category_offset[f]:category_offset[f + 1] 为特征 f 的取值，连续特征为空段
+        cats = [np.asarray(c) if c is not None else np.empty(0) for c in flat.categories]
+        arrays["categories"] = np.concatenate(cats) if cats else np.empty(0)
+        arrays["category_offset"] = np.concatenate(([0], np.cumsum([len(c) for c in cats])))
+    else:
+        meta["kind"] = "cart"
+        names = CART_ARRAYS
+    for name in names:
+        arrays[name] = getattr(flat, name)
+    arrays = {name: _to_disk(arr) for name, arr in arrays.items()}
+
+    # 元数据里的 offset 依赖元数据本身的长度，先按占位值估算，再定稿
+    meta["arrays"] = {name: {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 0} for name, arr in arrays.items()}
+    while True:
+        header = json.dumps(meta).encode("utf-8")
+        pos = _align(16 + len(header))
+        changed = False
+        for name, arr in arrays.items():
+            if meta["arrays"][name]["offset"] != pos:
+                meta["arrays"][name]["offset"] = pos
+                changed = True
+            pos = _align(pos + arr.nbytes)
+        if not changed:
+            break
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([VERSION, len(header)], dtype="<u4").tobytes())
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(meta["arrays"][name]["offset"])
+            f.write(arr.tobytes())
+
+
+def read_meta(path):
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError("%s is not a decision tree model file" % path)
+        version, length = np.frombuffer(f.read(8), dtype="<u4")
+        if version > VERSION:
+            raise ValueError("model file version %d is newer than supported version %d" % (version, VERSION))
+        return json.loads(f.read(int(length)).decode("utf-8"))
+
+
+def load(path, cls=None):
+    meta = read_meta(path)
+    arrays = {}
+    for name, spec in meta["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=spec["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+
+    if meta["kind"] == "c45":
+        from C45 import C45, FlatTree
+
+        # 版本 1 的 C4.5 文件没有 fallback 叶子，预测规则不同，需要重新训练保存
+        if "fallback" not in arrays:
+            raise ValueError("%s was saved before unseen-value fallbacks were added, refit and save again" % path)
+        cls = cls or C45
+        flat = FlatTree.__new__(FlatTree)
+        offset = arrays.pop("category_offset")
+        cats = arrays.pop("categories")
+        flat.categories = [
+            cats[offset[f] : offset[f + 1]] if kind == "discrete" else None
+            for f, kind in enumerate(meta["params"]["feature_types"])
+        ]
+    else:
+        from CART_1 import DecisionTree, FlatTree
+
+        cls = cls or DecisionTree
+        flat = FlatTree.__new__(FlatTree)
+    for name, arr in arrays.items():
+        setattr(flat, name, arr)
+
+    model = cls(**meta["params"])
+    model.flat = flat
+    return model
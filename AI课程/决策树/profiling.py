@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+# 可选的建树/预测插桩：构造 DecisionTree / C45 时传入 profiler=Profiler() 才会记录，默认 None 时
+# 每个节点只多一次 is None 判断
+# 每个节点记录：深度、样本数、评估过的候选阈值数、选中分割的增益（CART 为 gini 下降，C4.5 为增益率）、
+# 含子树的耗时和自身耗时；另有全局计数（节点数、划分用的 mask 数、拷贝的字节数）和预测路径长度
+# 线程后端下各线程各自维护节点栈；进程后端交给 worker 的子树不会被记录
+
+
+class Profiler:
+    def __init__(self):
+        self.nodes = []
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(list)
+        self.path_lengths = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # 进程后端发给 worker 的模型副本不带 profiler；但带着 profiler 的模型仍可能被 pickle 或 deepcopy
+    #（存下训练好的模型、交给别的进程），锁和线程局部变量不能序列化，去掉后在另一边重建
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"], state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, depth, rows):
+        stack = self._stack()
+        record = {
+            "id": -1,
+            "parent": stack[-1]["id"] if stack else -1,
+            "depth": depth,
+            "rows": int(rows),
+            "candidates": 0,
+            "gain": None,
+            "feature": None,
+            "leaf": None,
+            "seconds": 0.0,
+            "self_seconds": 0.0,
+            "start": time.perf_counter(),
+        }
+        with self._lock:
+            record["id"] = len(self.nodes)
+            self.nodes.append(record)
+        stack.append(record)
+
+    def end(self, node):
+        record = self._stack().pop()
+        record["seconds"] = time.perf_counter() - record.pop("start")
+        record["self_seconds"] += record["seconds"]
+        if record["parent"] >= 0:
+            self.nodes[record["parent"]]["self_seconds"] -= record["seconds"]
+        # 交给 worker 的子树此时还是 Future，没有 is_leaf，只记一次 deferred；
+        # 线程后端下它在 worker 线程里重新从 begin 开始记录，parent 为 -1
+        if not hasattr(node, "is_leaf"):
+            with self._lock:
+                self.counters["deferred"] += 1
+            return
+        record["leaf"] = node.is_leaf()
+        record["feature"] = None if node.is_leaf() else int(node.feature)
+        with self._lock:
+            self.counters["nodes"] += 1
+            if record["leaf"]:
+                self.counters["leaves"] += 1
+
+    # 累加全局计数；正在建的节点上同名字段也一起累加。全局计数由多个线程共享，加锁更新
+    def add(self, key, n=1):
+        with self._lock:
+            self.counters[key] += int(n)
+        stack = self._stack()
+        if stack and key in stack[-1]:
+            stack[-1][key] += int(n)
+
+    def set(self, **info):
+        stack = self._stack()
+        if stack:
+            stack[-1].update(info)
+
+    def paths(self, lengths):
+        self.path_lengths.append(np.asarray(lengths))
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name].append(time.perf_counter() - start)
+
+    def summary(self):
+        lengths = np.concatenate(self.path_lengths) if self.path_lengths else np.empty(0, dtype=np.intp)
+        by_depth = defaultdict(lambda: {"nodes": 0, "rows": 0, "candidates": 0, "seconds": 0.0})
+        for record in self.nodes:
+            level = by_depth[record["depth"]]
+            level["nodes"] += 1
+            level["rows"] += record["rows"]
+            level["candidates"] += record["candidates"]
+            level["seconds"] += record["self_seconds"]
+        return {
+            "counters": dict(self.counters),
+            "timings": {name: sum(values) for name, values in self.timings.items()},
+            "by_depth": {depth: by_depth[depth] for depth in sorted(by_depth)},
+            "path_length": {
+                "rows": int(len(lengths)),
+                "mean": float(lengths.mean()) if len(lengths) else 0.0,
+                "max": int(lengths.max()) if len(lengths) else 0,
+                "histogram": np.bincount(lengths).tolist() if len(lengths) else [],
+            },
+        }
+
+    def to_json(self, path):
+        data = {"summary": self.summary(), "nodes": self.nodes}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1, default=float)
+
+    # flamegraph.pl / speedscope 可读的 folded stack 格式：每行 "帧;帧;... 微秒数"，值为节点自身耗时
+    def to_folded(self, path, root="fit"):
+        frames = []
+        for record in self.nodes:
+            if record["leaf"] is None:
+                name = "depth%d:worker" % record["depth"]
+            elif record["leaf"]:
+                name = "depth%d:leaf" % record["depth"]
+            else:
+                name = "depth%d:f%d" % (record["depth"], record["feature"])
+            if record["parent"] >= 0:
+                parent = frames[record["parent"]]
+            else:
+                parent = root if record["depth"] == 0 else root + ";worker"
+            frames.append(parent + ";" + name)
+        stacks = defaultdict(int)
+        for frame, record in zip(frames, self.nodes):
+            stacks[frame] += max(int(round(record["self_seconds"] * 1e6)), 0)
+        with open(path, "w") as f:
+            for frame, micros in stacks.items():
+                f.write("%s %d\n" % (frame, micros))
@@ -0,0 +1,36 @@
+import numpy as np
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+# 父进程用 share 把数组各拷进一块共享内存，得到 (name, shape, dtype) 描述；
+# worker 进程用 attach 按描述映射回 ndarray，数据本身不经过 pickle
+
+_attached = []
+
+
+@contextmanager
+def share(*arrays):
+    blocks = []
+    try:
+        specs = []
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            specs.append((shm.name, arr.shape, arr.dtype.str))
+        yield specs
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def attach(*specs):
+    arrays = []
+    for name, shape, dtype in specs:
+        shm = shared_memory.SharedMemory(name=name)
+        # 映射要活得和 worker 一样久
+        _attached.append(shm)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return arrays
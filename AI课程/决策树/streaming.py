@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# 大 CSV 的流式训练：按块读两遍文件，内存里只留每块数据和各列的摘要
+#   第一遍：每列一个可合并的分位数草图，顺带统计行数、类别和能无损压缩到的最小 dtype
+#   第二遍：由草图定出分箱边界，把原始列（压缩后 dtype）、分箱编码和标签写进磁盘上的 .npy，
+#           同时累加根节点的 (特征, 箱, 类别) 直方图和 C4.5 连续特征需要的 bin_next
+# 之后 fit 用内存映射的编码矩阵走 fit_binned，编码每个值只占 1 字节，按列存放
+# 建树时内存占用只与行数成正比、与特征数无关：每行一个样本下标和一个标签编码，加上划分和计数时
+# O(节点行数) 的临时数组（1M 行时峰值约 50MB）；直方图逐列统计，不会生成 行数 × 特征数 的临时矩阵
+# 所以编码矩阵可以远大于内存，行数本身仍受这些按行数组的限制
+
+
+class QuantileSketch:
+    # 按取值排序的 (values, weights)；点数超过 2 * size 时按累计权重等距保留 size 个点，
+    # 被丢掉的点把权重并给右边第一个保留点，最大值总是保留；没压缩过时 exact 为 True，结果与精确统计相同
+    def __init__(self, size=4096):
+        self.size = size
+        self.values = np.empty(0)
+        self.weights = np.empty(0, dtype=np.int64)
+        self.exact = True
+
+    def update(self, col):
+        values, counts = np.unique(col, return_counts=True)
+        self._add(values, counts)
+
+    def merge(self, other):
+        self._add(other.values, other.weights)
+        self.exact = self.exact and other.exact
+
+    def _add(self, values, weights):
+        values = np.concatenate((self.values, values))
+        weights = np.concatenate((self.weights, weights))
+        self.values, inverse = np.unique(values, return_inverse=True)
+        self.weights = np.bincount(inverse, weights=weights).astype(np.int64)
+        if len(self.values) > 2 * self.size:
+            cum = np.cumsum(self.weights)
+            keep = np.unique(np.searchsorted(cum, np.linspace(cum[-1] / self.size, cum[-1], self.size)))
+            self.values = self.values[keep]
+            self.weights = np.diff(np.concatenate(([0], cum[keep])))
+            self.exact = False
+
+    # 与 np.quantile(method="inverted_cdf") 相同：累计权重首次达到 q * 总数的取值
+    def quantiles(self, q):
+        cum = np.cumsum(self.weights)
+        pos = np.searchsorted(cum, np.asarray(q) * cum[-1], side="left")
+        return self.values[np.minimum(pos, len(cum) - 1)]
+
+
+def _compact_dtype(integral, lo, hi, float32_ok):
+    if integral:
+        for dtype in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                return np.dtype(dtype)
+    return np.dtype(np.float32 if float32_ok else np.float64)
+
+
+class Store:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.feature_types = meta["feature_types"]
+        self.classes = np.array(meta["classes"])
+        self.bin_edges = [np.array(edges) for edges in meta["bin_edges"]]
+        self.bin_next = [np.array(nxt) if nxt is not None else None for nxt in meta["bin_next"]]
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        self.y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+        self.hist = np.load(os.path.join(path, "hist.npy"))
+
+    def column(self, f):
+        return np.load(os.path.join(self.path, "x%d.npy" % f), mmap_mode="r")
+
+
+# store_path 为列存储目录，由调用方决定保留或删除
+def ingest(csv_path, store_path, max_bins=255, feature_types=None, chunksize=100000, sketch_size=4096):
+    if max_bins > 255:
+        raise ValueError("max_bins must be at most 255, got %d" % max_bins)
+    os.makedirs(store_path, exist_ok=True)
+
+    # 第一遍：草图、行数、类别、dtype
+    m = 0
+    sketches = None
+    labels = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        arr = chunk.to_numpy(dtype=np.float64)
+        if sketches is None:
+            columns = list(chunk.columns)
+            n = arr.shape[1] - 1
+            feature_types = feature_types or ["continuous"] * n
+            sketches = [QuantileSketch(sketch_size) for _ in range(n)]
+            labels = np.empty(0)
+            integral = np.ones(n + 1, dtype=bool)
+            float32_ok = np.ones(n + 1, dtype=bool)
+            lo = np.full(n + 1, np.inf)
+            hi = np.full(n + 1, -np.inf)
+        for f in range(n):
+            sketches[f].update(arr[:, f])
+        labels = np.union1d(labels, arr[:, -1])
+        integral &= np.all(arr == np.round(arr), axis=0)
+        float32_ok &= np.all(arr.astype(np.float32) == arr, axis=0)
+        lo = np.minimum(lo, arr.min(axis=0))
+        hi = np.maximum(hi, arr.max(axis=0))
+        m += len(arr)
+    if sketches is None:
+        raise ValueError("%s has no rows" % csv_path)
+    dtypes = [_compact_dtype(integral[f], lo[f], hi[f], float32_ok[f]) for f in range(n + 1)]
+
+    # 分箱边界：与 DecisionTree._quantize / C45._quantize 的规则相同，草图精确时结果也完全相同
+    q = np.linspace(0, 1, max_bins + 1)[1:]
+    bin_edges = []
+    for f, sketch in enumerate(sketches):
+        if feature_types[f] == "discrete":
+            if not sketch.exact or len(sketch.values) > 256:
+                raise ValueError("discrete column %r has too many distinct values" % columns[f])
+            edges = sketch.values
+        elif sketch.exact and len(sketch.values) <= max_bins:
+            edges = sketch.values
+        else:
+            edges = np.unique(sketch.quantiles(q))
+        bin_edges.append(edges)
+    classes = labels.astype(dtypes[-1])
+    bins = max(len(edges) for edges in bin_edges)
+    k = len(classes)
+
+    # 第二遍：写列存储和编码，累加直方图与 bin_next
+    codes = np.lib.format.open_memmap(os.path.join(store_path, "codes.npy"), mode="w+", dtype=np.uint8, shape=(m, n), fortran_order=True)
+    y = np.lib.format.open_memmap(os.path.join(store_path, "y.npy"), mode="w+", dtype=dtypes[-1], shape=(m,))
+    cols = [
+        np.lib.format.open_memmap(os.path.join(store_path, "x%d.npy" % f), mode="w+", dtype=dtypes[f], shape=(m,))
+        for f in range(n)
+    ]
+    hist = np.zeros((n, bins * k), dtype=np.int64)
+    nxt = [np.full(max(len(edges) - 1, 0), np.inf) for edges in bin_edges]
+    start = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        arr = chunk.to_numpy(dtype=np.float64)
+        end = start + len(arr)
+        block = np.empty((len(arr), n), dtype=np.uint8)
+        for f in range(n):
+            col = arr[:, f]
+            block[:, f] = np.searchsorted(bin_edges[f], col)
+            cols[f][start:end] = col
+            above = block[:, f] > 0
+            np.minimum.at(nxt[f], block[above, f].astype(np.intp) - 1, col[above])
+        codes[start:end] = block
+        y[start:end] = arr[:, -1]
+        y_code = np.searchsorted(classes, arr[:, -1])
+        for f in range(n):
+            hist[f] += np.bincount(block[:, f].astype(np.intp) * k + y_code, minlength=bins * k)
+        start = end
+    for arr in [codes, y] + cols:
+        arr.flush()
+    np.save(os.path.join(store_path, "hist.npy"), hist.reshape(n, bins, k))
+
+    bin_next = [nxt[f].tolist() if feature_types[f] == "continuous" else None for f in range(n)]
+    meta = {
+        "columns": columns,
+        "rows": m,
+        "dtypes": [dtype.str for dtype in dtypes],
+        "feature_types": feature_types,
+        "classes": classes.tolist(),
+        "bin_edges": [edges.tolist() for edges in bin_edges],
+        "bin_next": bin_next,
+    }
+    with open(os.path.join(store_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return Store(store_path)
+
+
+def fit(model, store):
+    if model.max_bins is None:
+        model.max_bins = max(len(edges) for edges in store.bin_edges)
+    if hasattr(model, "feature_types"):
+        model.fit_binned(store.codes, store.y, store.feature_types, store.bin_edges, store.bin_next, store.hist)
+    else:
+        model.fit_binned(store.codes, store.y, store.bin_edges, store.hist)
+    return model
+
+
+if __name__ == "__main__":
+    from CART_1 import DecisionTree
+
+    # 演示用的列存储放在临时目录里，结束时删除
+    with tempfile.TemporaryDirectory(prefix="dtree_store_") as store_path:
+        store = ingest("heartdisease.csv", store_path, chunksize=1000)
+        tree = fit(DecisionTree(max_depth=10, max_bins=255), store)
+        x = np.column_stack([store.column(f) for f in range(len(store.bin_edges))])
+        print("train acc: %.2f%%" % (np.mean(tree.predict(x) == store.y) * 100))
@@ -0,0 +1,93 @@
+import copy
+import numpy as np
+import pandas as pd
+from CART_1 import DecisionTree, FlatTree
+
+# max_depth / min_samples_split 网格搜索只建一棵树：
+# 用网格里最深、min_samples_split 最小的参数建树，(d, s) 对应的树就是把它在 depth >= d 或 n_samples < s 的
+# 第一个节点处截断、以该节点的 major 为叶子得到的，节点上的分割与这两个参数无关
+# 每个验证样本只下推一次记下整条路径，之后每组参数只是在路径上找第一个截断点
+
+
+def _collect(root):
+    nodes = [root]
+    depth = [0]
+    for i, node in enumerate(nodes):
+        if not node.is_leaf():
+            nodes += [node.left, node.right]
+            depth += [depth[i] + 1] * 2
+    return nodes, np.array(depth)
+
+
+def sweep(x, y, vx, vy, max_depths, min_samples_splits, **params):
+    max_depths = list(max_depths)
+    min_samples_splits = list(min_samples_splits)
+    tree = DecisionTree(max_depth=max(max_depths), min_samples_split=min(min_samples_splits), **params)
+    tree.fit(x, y)
+    vx = np.asarray(vx)
+    vy = np.asarray(vy)
+
+    nodes, depth = _collect(tree.root)
+    ids = {id(node): i for i, node in enumerate(nodes)}
+    n_samples = np.array([node.n_samples for node in nodes])
+    major = np.array([node.major for node in nodes])
+    is_leaf = np.array([node.is_leaf() for node in nodes])
+    left = np.array([ids[id(node.left)] if not node.is_leaf() else i for i, node in enumerate(nodes)])
+    right = np.array([ids[id(node.right)] if not node.is_leaf() else i for i, node in enumerate(nodes)])
+    feature = np.array([node.feature if not node.is_leaf() else 0 for node in nodes])
+    threshold = np.array([node.threshold if not node.is_leaf() else 0.0 for node in nodes])
+
+    # path[r, l] 为第 r 个验证样本在第 l 层所在的节点，到叶子后原地不动
+    levels = depth.max() + 1
+    path = np.zeros((len(vy), levels), dtype=np.intp)
+    rows = np.arange(len(vy))
+    for level in range(1, levels):
+        cur = path[:, level - 1]
+        go_right = vx[rows, feature[cur]] > threshold[cur]
+        path[:, level] = np.where(is_leaf[cur], cur, np.where(go_right, right[cur], left[cur]))
+
+    acc = np.zeros((len(max_depths), len(min_samples_splits)))
+    for i, d in enumerate(max_depths):
+        for j, s in enumerate(min_samples_splits):
+            stop = is_leaf[path] | (depth[path] >= d) | (n_samples[path] < s)
+            first = np.argmax(stop, axis=1)
+            pred = major[path[rows, first]]
+            acc[i, j] = np.count_nonzero(pred == vy) / len(vy) * 100
+    return {"acc": acc, "max_depth": max_depths, "min_samples_split": min_samples_splits, "tree": tree}
+
+
+# 由最宽松的树截断出 (max_depth, min_samples_split) 对应的树，原树不变
+def truncate(tree, max_depth, min_samples_split):
+    def cut(node, depth):
+        if node.is_leaf():
+            return copy.copy(node)
+        if depth >= max_depth or node.n_samples < min_samples_split:
+            res = copy.copy(node)
+            res.feature = res.threshold = res.left = res.right = None
+            res.value = node.major
+            return res
+        res = copy.copy(node)
+        res.left = cut(node.left, depth + 1)
+        res.right = cut(node.right, depth + 1)
+        return res
+
+    res = copy.copy(tree)
+    res.max_depth = max_depth
+    res.min_samples_split = min_samples_split
+    res.root = cut(tree.root, 0)
+    res.flat = FlatTree(res.root)
+    return res
+
+
+if __name__ == "__main__":
+    df = pd.read_csv("heartdisease.csv")
+    data = df.to_numpy()
+    indices = np.random.default_rng(0).permutation(len(data))
+    r = [0.2, 0.1]
+    test_len = int(r[0] * len(data))
+    eval_len = int(r[1] * len(data))
+    eval_idx, train_idx = indices[test_len : test_len + eval_len], indices[test_len + eval_len :]
+    result = sweep(data[train_idx, :-1], data[train_idx, -1], data[eval_idx, :-1], data[eval_idx, -1], range(1, 11), range(2, 21, 2))
+    print("max_depth \\ min_samples_split:", result["min_samples_split"])
+    for d, row in zip(result["max_depth"], result["acc"]):
+        print("%2d " % d + " ".join("%6.2f" % a for a in row))
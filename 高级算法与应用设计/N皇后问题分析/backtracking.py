@@ -1,35 +1,82 @@
-def judge(q: list[int]) -> bool:
-    for i in range(len(q)):
-        for j in range(i + 1, len(q)):
-            if q[i] == q[j] or j - i == abs(q[j] - q[i]):
-                return False
-    return True
-
-
-def dfs(n, t) -> None:
-    global cnt
-    if t >= n:
-        if judge(pos):
-            cnt += 1
+# 位掩码回溯：第 i 列对应第 i 位
+#   cols：已被占用的列
+#   ld：  已被占用的"左上-右下"对角线在当前行的投影，下移一行时整体左移一位
+#   rd：  已被占用的"右上-左下"对角线在当前行的投影，下移一行时整体右移一位
+# 当前行可放的位置为 ~(cols | ld | rd)，每次用 a & -a 取最低位；放置时已保证合法，到达最后一行即计数，无需再检查整盘
+# 用显式栈代替递归，每层只保存四个整数
+
+
+def count_from(n, row, cols, ld, rd) -> int:
+    if row >= n:
+        return 1
+    full = (1 << n) - 1
+    depth = n - row
+    cs = [0] * depth
+    ls = [0] * depth
+    rs = [0] * depth
+    avail = [0] * depth
+    cs[0], ls[0], rs[0] = cols, ld, rd
+    avail[0] = full & ~(cols | ld | rd)
+    last = depth - 1
+    cnt = 0
+    d = 0
+    while d >= 0:
+        a = avail[d]
+        # 最后一行每个空位都是一个解
+        if d == last:
+            cnt += bin(a).count("1")
+            d -= 1
+            continue
+        if not a:
+            d -= 1
+            continue
+        bit = a & -a
+        avail[d] = a ^ bit
+        c = cs[d] | bit
+        l = ((ls[d] | bit) << 1) & full
+        r = (rs[d] | bit) >> 1
+        d += 1
+        cs[d], ls[d], rs[d] = c, l, r
+        avail[d] = full & ~(c | l | r)
+    return cnt
+
+
+def count(n) -> int:
+    return count_from(n, 0, 0, 0, 0)
+
+
+# 逐个给出解，pos[t] 为第 t 行皇后所在的列
+def solutions(n):
+    if n <= 0:
+        yield []
         return
-    for i in range(n):
-        if not is_used[i]:
-            valid = True
-            for j in range(t):
-                if j-pos[j] == t-i or j+pos[j]==t+i:
-                    valid = False
-                    break
-            if valid:
-                is_used[i] = True
-                pos[t] = i
-                dfs(n, t + 1)
-                is_used[i] = False
-    return
-
-
-n=int(input())
-cnt = 0
-is_used = [False] * n
-pos = [0] * n
-dfs(n, 0)
-print(cnt)
+    full = (1 << n) - 1
+    cs = [0] * n
+    ls = [0] * n
+    rs = [0] * n
+    avail = [0] * n
+    pos = [0] * n
+    avail[0] = full
+    d = 0
+    while d >= 0:
+        a = avail[d]
+        if not a:
+            d -= 1
+            continue
+        bit = a & -a
+        avail[d] = a ^ bit
+        pos[d] = bit.bit_length() - 1
+        if d == n - 1:
+            yield list(pos)
+            continue
+        c = cs[d] | bit
+        l = ((ls[d] | bit) << 1) & full
+        r = (rs[d] | bit) >> 1
+        d += 1
+        cs[d], ls[d], rs[d] = c, l, r
+        avail[d] = full & ~(c | l | r)
+
+
+if __name__ == "__main__":
+    n = int(input())
+    print(count(n))
@@ -0,0 +1,66 @@
+import sys
+import backtracking
+import enumerative
+import branch_bound
+import parallel
+import symmetry
+
+# 回归检查：python checks.py [检查名 ...]，全部通过时每项打印一行 ok，任何一项不符直接 AssertionError
+# 各解法的计数都与已知解数（OEIS A000170）及 backtracking.count 比较
+#   backtracking：count 和 solutions 给出的解数
+#   symmetry：只搜半边的 count_half 和按 8 种对称分类得到的总数
+#   parallel：对称 / 不对称前缀、自动和手动指定的 k 与 chunksize 下的多进程计数
+#   branch_bound：默认预算和很小的内存预算（中途改为深度优先）下的计数
+#   enumerative：按块枚举排列的计数，覆盖 n 小于和大于块大小 BLOCK 两种情况
+
+KNOWN = [1, 1, 0, 0, 2, 10, 4, 40, 92, 352, 724, 2680, 14200]
+
+
+def check_backtracking():
+    for n, known in enumerate(KNOWN):
+        assert backtracking.count(n) == known, n
+        assert sum(1 for _ in backtracking.solutions(n)) == known, n
+    print("backtracking ok")
+
+
+def check_symmetry():
+    for n in range(0, 11):
+        expected = backtracking.count(n)
+        assert symmetry.count_half(n) == expected, n
+        assert symmetry.classify(n)[0] == expected, n
+    assert [symmetry.classify(n)[1] for n in range(1, 11)] == [1, 0, 0, 1, 2, 1, 6, 12, 46, 92]
+    print("symmetry ok")
+
+
+def check_parallel():
+    for n in range(1, 12):
+        expected = backtracking.count(n)
+        assert parallel.count(n, n_jobs=2, progress=False) == expected, n
+        assert parallel.count(n, n_jobs=2, symmetric=False, progress=False) == expected, n
+        for k in range(1, n):
+            assert parallel.count(n, n_jobs=2, k=k, chunksize=3, progress=False) == expected, (n, k)
+    print("parallel ok")
+
+
+def check_branch_bound():
+    for n in range(0, 11):
+        expected = backtracking.count(n)
+        assert branch_bound.solve(n)["count"] == expected, n
+        res = branch_bound.solve(n, budget=10 * branch_bound.STATE_BYTES)
+        assert res["count"] == expected, n
+        # 每层至多超出预算一个状态的全部子状态（不超过 n 个），本层和下一层各一份
+        assert res["peak_states"] <= 2 * (10 + n), n
+    print("branch_bound ok")
+
+
+def check_enumerative():
+    for n in range(0, enumerative.BLOCK + 2):
+        assert enumerative.count(n) == backtracking.count(n), n
+    print("enumerative ok")
+
+
+CHECKS = {"backtracking": check_backtracking, "symmetry": check_symmetry, "parallel": check_parallel, "branch_bound": check_branch_bound, "enumerative": check_enumerative}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or CHECKS:
+        CHECKS[name]()
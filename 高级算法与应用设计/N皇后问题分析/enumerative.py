@@ -1,20 +1,39 @@
-def judge(q: list[int]) -> bool:
-    for i in range(len(q)):
-        for j in range(i + 1, len(q)):
-            if q[i] == q[j] or j - i == abs(q[j] - q[i]):
-                return False
-    return True
-
-
-n=int(input())
-tot = n**n
-res = 0
-for cnt in range(tot):
-    pos = []
-    while cnt:
-        pos.append(cnt % n)
-        cnt //= n
-    pos += (n - len(pos)) * [0]
-    if judge(pos):
-        res += 1
-print(n, res)
+import numpy as np
+from itertools import permutations
+
+# 暴力枚举，作为其他解法的对照：每行一个皇后、各行列号互不相同的放法正好是 n! 个排列，
+# 列冲突不用再检查，只需对每对行 (i, j) 判断 |pos[i] - pos[j]| != j - i
+# 排列按块生成：前 n-m 行取遍所有有序前缀，后 m 行用预先算好的 m! 个排列，每块 m! 个候选一次性检查
+# 块按行存放，block[r] 是所有候选第 r 行的列号，每次比较都是两段连续内存上的向量运算
+
+BLOCK = 8
+
+
+def _valid(block):
+    n = len(block)
+    ok = np.ones(block.shape[1], dtype=bool)
+    for i in range(n):
+        for j in range(i + 1, n):
+            d = block[i] - block[j]
+            ok &= (d != j - i) & (d != i - j)
+    return ok
+
+
+def count(n) -> int:
+    if n <= 0:
+        return 1
+    m = min(n, BLOCK)
+    table = np.array(list(permutations(range(m))), dtype=np.int8).T.copy()
+    block = np.empty((n, table.shape[1]), dtype=np.int8)
+    res = 0
+    for prefix in permutations(range(n), n - m):
+        rest = np.array(sorted(set(range(n)) - set(prefix)), dtype=np.int8)
+        block[: n - m] = np.array(prefix, dtype=np.int8)[:, None]
+        block[n - m :] = rest[table]
+        res += int(np.count_nonzero(_valid(block)))
+    return res
+
+
+if __name__ == "__main__":
+    n = int(input())
+    print(n, count(n))
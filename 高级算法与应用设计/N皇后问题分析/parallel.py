@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from backtracking import count_from
+
+# 多进程计数：先枚举前 k 行的所有合法放置（前缀），每个前缀是一个独立子问题，交给进程池用 count_from 数完再求和
+# 前缀按镜像对称只取一半：第一行在左半边的前缀权重为 2；n 为奇数时第一行在中间列的前缀，第二行只取左半边，权重也为 2
+# k 自动取最小的、使前缀数不少于 worker 数 * per_worker 的值，子问题足够多、大小参差时各进程也能均衡
+# 前缀切成小块逐块提交，哪个进程空闲就取下一块（动态调度），每块完成时在 stderr 上报各进程的进度
+
+
+def prefixes(n, k, symmetric=True):
+    full = (1 << n) - 1
+    res = []
+    stack = [(0, 0, 0, 0, 1)]
+    while stack:
+        row, cols, ld, rd, weight = stack.pop()
+        if row == k:
+            res.append((cols, ld, rd, weight))
+            continue
+        avail = full & ~(cols | ld | rd)
+        for c in range(n):
+            bit = 1 << c
+            if not avail & bit:
+                continue
+            w = weight
+            if symmetric and row == 0 and n > 1:
+                if c > n // 2 or (c == n // 2 and n % 2 == 0):
+                    continue
+                w = 2 if c < n // 2 else 1
+            elif symmetric and row == 1 and n % 2 and cols == 1 << (n // 2):
+                if c > n // 2:
+                    continue
+                w = 2
+            stack.append((row + 1, cols | bit, ((ld | bit) << 1) & full, (rd | bit) >> 1, w))
+    # 按第一行的列排序，结果与调度无关
+    res.sort()
+    return res
+
+
+def choose_k(n, workers, per_worker=32, symmetric=True):
+    target = workers * per_worker
+    for k in range(1, n):
+        if len(prefixes(n, k, symmetric)) >= target:
+            return k
+    return max(n - 1, 0)
+
+
+def _count_chunk(n, k, chunk):
+    start = time.perf_counter()
+    res = 0
+    for cols, ld, rd, weight in chunk:
+        res += weight * count_from(n, k, cols, ld, rd)
+    return os.getpid(), res, len(chunk), time.perf_counter() - start
+
+
+def count(n, n_jobs=-1, k=None, chunksize=None, symmetric=True, progress=True):
+    if n <= 3:
+        return count_from(n, 0, 0, 0, 0)
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    k = k or choose_k(n, n_jobs, symmetric=symmetric)
+    subproblems = prefixes(n, k, symmetric)
+    # 每个 worker 平均分到约 8 块，块小到足够均衡，又不至于让提交开销占比过大
+    chunksize = chunksize or max(len(subproblems) // (n_jobs * 8), 1)
+    chunks = [subproblems[i : i + chunksize] for i in range(0, len(subproblems), chunksize)]
+
+    total = 0
+    done = 0
+    per_worker = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = [pool.submit(_count_chunk, n, k, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            pid, res, size, seconds = future.result()
+            total += res
+            done += size
+            stat = per_worker.setdefault(pid, [0, 0, 0.0])
+            stat[0] += size
+            stat[1] += res
+            stat[2] += seconds
+            if progress:
+                workers = "  ".join("%d:%d/%.1fs" % (p, s[0], s[2]) for p, s in sorted(per_worker.items()))
+                print(
+                    "\r[k=%d] %d/%d prefixes  %.1fs  %s" % (k, done, len(subproblems), time.perf_counter() - start, workers),
+                    end="",
+                    file=sys.stderr,
+                )
+    if progress:
+        print(file=sys.stderr)
+    return total
+
+
+if __name__ == "__main__":
+    n = int(input())
+    print(count(n))
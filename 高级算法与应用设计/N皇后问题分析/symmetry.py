@@ -0,0 +1,69 @@
+from backtracking import count_from, solutions
+
+# 利用棋盘对称性减少搜索
+# 左右镜像把第一行皇后在第 c 列的解一一对应到第 n-1-c 列的解，所以第一行只搜左半边再乘 2；
+# n 为奇数时第一行放中间列的解单独算，此时第二行同样只搜左半边再乘 2（第二行不可能也在中间列）
+# counter 为从某个部分放置继续计数的函数，参数同 backtracking.count_from，可换成其他搜索策略
+
+
+def _place(n, bit, cols, ld, rd):
+    full = (1 << n) - 1
+    return cols | bit, ((ld | bit) << 1) & full, (rd | bit) >> 1
+
+
+def count_half(n, counter=count_from) -> int:
+    if n <= 1:
+        return counter(n, 0, 0, 0, 0)
+    res = 0
+    for c in range(n // 2):
+        res += counter(n, 1, *_place(n, 1 << c, 0, 0, 0))
+    res *= 2
+    if n % 2:
+        mid = _place(n, 1 << (n // 2), 0, 0, 0)
+        half = 0
+        for c in range(n // 2):
+            bit = 1 << c
+            if not bit & (mid[0] | mid[1] | mid[2]):
+                half += counter(n, 2, *_place(n, bit, *mid))
+        res += 2 * half
+    return res
+
+
+# 二面体群 D4 的 8 个变换作用在 pos（pos[r] 为第 r 行的列）上
+def _transforms(pos):
+    n = len(pos)
+    res = []
+    cur = list(pos)
+    for _ in range(4):
+        res.append(tuple(cur))
+        res.append(tuple(n - 1 - c for c in cur))
+        # 顺时针转 90 度：(r, c) -> (c, n-1-r)
+        nxt = [0] * n
+        for r, c in enumerate(cur):
+            nxt[c] = n - 1 - r
+        cur = nxt
+    return res
+
+
+# 按 8 种对称把解分成等价类，返回 (解的总数, 本质不同的解数)
+# 每个等价类只在字典序最小的代表元处计一次，并按轨道大小累加总数；
+# 代表元第一行的列不超过 (n-1)/2（否则它的镜像更小），而 solutions 按第一行的列从小到大给出，超过后即可停止
+def classify(n):
+    total = 0
+    fundamental = 0
+    for pos in solutions(n):
+        if pos and pos[0] > (n - 1) // 2:
+            break
+        pos = tuple(pos)
+        orbit = _transforms(pos)
+        if pos == min(orbit):
+            fundamental += 1
+            total += len(set(orbit))
+    return total, fundamental
+
+
+if __name__ == "__main__":
+    n = int(input())
+    print(count_half(n))
+    total, fundamental = classify(n)
+    print(total, fundamental)